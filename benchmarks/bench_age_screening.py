@@ -0,0 +1,63 @@
+"""Account-age screening over synthetic member IDs.
+
+Compares the old per-member datetime subtraction with the precomputed snowflake
+cutoff (one integer compare per ID) and the per-page batch screen.
+
+    python benchmarks/bench_age_screening.py --ids 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+import bot  # noqa: E402
+from discord.utils import snowflake_time  # noqa: E402
+
+
+def synthetic_ids(count: int, seed: int = 0) -> list[int]:
+    # Accounts created uniformly over the last two years.
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    low = bot.snowflake_cutoff(now - timedelta(days=730))
+    high = bot.snowflake_cutoff(now)
+    return [rng.randrange(low, high) for _ in range(count)]
+
+
+def screen_datetime(ids: list[int]) -> int:
+    current_time = datetime.now(timezone.utc)
+    return sum(1 for member_id in ids if (current_time - snowflake_time(member_id)).days < bot.MIN_ACCOUNT_AGE_DAYS)
+
+
+def screen_snowflake(ids: list[int]) -> int:
+    screen = bot.AccountAgeScreen(bot.MIN_ACCOUNT_AGE_DAYS)
+    return sum(1 for member_id in ids if screen.is_too_new(member_id))
+
+
+def screen_batch(ids: list[int]) -> int:
+    cutoff = bot.AccountAgeScreen(bot.MIN_ACCOUNT_AGE_DAYS).cutoff()
+    kicked = 0
+    for i in range(0, len(ids), bot.CATCHUP_PAGE_SIZE):
+        kick, _, _ = bot.screen_member_ids(ids[i:i + bot.CATCHUP_PAGE_SIZE], cutoff)
+        kicked += len(kick)
+    return kicked
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ids', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    ids = synthetic_ids(args.ids)
+    for name, fn in (('datetime', screen_datetime), ('snowflake', screen_snowflake), ('batch', screen_batch)):
+        started = time.perf_counter()
+        kicked = fn(ids)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<10} {args.ids} ids in {elapsed * 1000:.0f}ms ({elapsed / args.ids * 1e9:.0f}ns/id), too new: {kicked}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Event-loop lag under a synthetic burst of member joins.
+
+Compares the old per-call ``sqlite3.connect`` helpers (run inline on the loop)
+with the executor-backed ``VerificationDB`` and write-behind buffer used by bot.py.
+
+    python benchmarks/bench_event_loop_lag.py --joins 10000
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+import bot  # noqa: E402
+
+GUILD_ID = 1
+TICK_SECONDS = 0.005
+
+
+def legacy_mark_member_verified(path: str, guild_id: int, member_id: int):
+    # Mirrors the pre-VerificationDB helper: new connection + commit per call.
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('''
+            INSERT OR REPLACE INTO verified_members (guild_id, member_id, verified_at)
+            VALUES (?, ?, ?)
+        ''', (guild_id, member_id, datetime.now(timezone.utc).isoformat()))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+async def monitor_lag(samples: list, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK_SECONDS
+        await asyncio.sleep(TICK_SECONDS)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def run_burst(joins: int, handler, drain=None) -> dict:
+    samples = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_lag(samples, stop))
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(member_id) for member_id in range(1, joins + 1)))
+    if drain is not None:
+        await drain()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    samples.sort()
+    return {
+        'elapsed_s': elapsed,
+        'ticks': len(samples),
+        'lag_p50_ms': statistics.median(samples) * 1000 if samples else 0.0,
+        'lag_p99_ms': samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000 if samples else 0.0,
+        'lag_max_ms': samples[-1] * 1000 if samples else 0.0,
+    }
+
+
+async def bench_legacy(path: str, joins: int) -> dict:
+    async def handler(member_id: int):
+        await asyncio.sleep(0)
+        legacy_mark_member_verified(path, GUILD_ID, member_id)
+    return await run_burst(joins, handler)
+
+
+async def bench_async(path: str, joins: int) -> dict:
+    bot.db = bot.VerificationDB(path)
+    try:
+        await bot.init_db()
+
+        async def handler(member_id: int):
+            await bot.mark_member_verified_in_db(GUILD_ID, member_id)
+        return await run_burst(joins, handler, drain=bot.flush_write_buffers)
+    finally:
+        bot.db.close()
+
+
+def report(name: str, result: dict):
+    print(f"{name:<10} elapsed={result['elapsed_s']:.2f}s ticks={result['ticks']} "
+          f"lag p50={result['lag_p50_ms']:.1f}ms p99={result['lag_p99_ms']:.1f}ms max={result['lag_max_ms']:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--joins', type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        conn = sqlite3.connect(legacy_path)
+        bot._init_db(conn)
+        conn.close()
+        legacy = asyncio.run(bench_legacy(legacy_path, args.joins))
+        current = asyncio.run(bench_async(os.path.join(tmp, 'current.db'), args.joins))
+    report('before', legacy)
+    report('after', current)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Kick throughput during a raid of new accounts, against a simulated REST layer with 429s.
+
+Compares the old serial "fetch_member then kick" loop with KickExecutor at
+several concurrency levels.
+
+    python benchmarks/bench_kick_throughput.py --members 500 --latency 0.05 --limit 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+import bot  # noqa: E402
+from fake_discord import FakeClient, FakeRest  # noqa: E402
+
+REASON = 'Account too new (benchmark).'
+
+
+def make_raid(rest: FakeRest, members: int):
+    client = FakeClient(rest)
+    guild = client.add_guild()
+    raiders = [guild.add_member(account_age_days=1) for _ in range(members)]
+    return guild, raiders
+
+
+async def bench_serial(args) -> dict:
+    rest = FakeRest(args.latency, args.limit, args.window)
+    guild, raiders = make_raid(rest, args.members)
+    started = time.perf_counter()
+    for member in raiders:
+        while True:
+            try:
+                await guild.fetch_member(member.id)
+                await member.kick(reason=REASON)
+                await bot.remove_member_from_db(guild.id, member.id)
+                break
+            except bot.discord.RateLimited as e:
+                await asyncio.sleep(e.retry_after)
+    return {'elapsed': time.perf_counter() - started, 'kicked': args.members, 'rest': rest}
+
+
+async def bench_executor(args, concurrency: int) -> dict:
+    rest = FakeRest(args.latency, args.limit, args.window)
+    guild, raiders = make_raid(rest, args.members)
+    executor = bot.KickExecutor(concurrency)
+    started = time.perf_counter()
+    for member in raiders:
+        executor.submit(member, REASON)
+    await executor.join()
+    return {'elapsed': time.perf_counter() - started, 'kicked': executor.stats()['kicked'], 'rest': rest}
+
+
+def report(name: str, result: dict):
+    rest = result['rest']
+    print(f"{name:<16} kicked={result['kicked']} elapsed={result['elapsed']:.2f}s "
+          f"throughput={result['kicked'] / result['elapsed']:.1f}/s rest_calls={sum(rest.calls.values())} 429s={rest.rate_limited}")
+
+
+async def run(args):
+    bot.db = bot.VerificationDB(os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    await bot.init_db()
+    results = [('serial+fetch', await bench_serial(args))]
+    for concurrency in args.concurrency:
+        results.append((f'executor x{concurrency}', await bench_executor(args, concurrency)))
+    await bot.flush_write_buffers()
+    bot.db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated REST latency in seconds')
+    parser.add_argument('--limit', type=int, default=20, help='requests per route per window before a 429')
+    parser.add_argument('--window', type=float, default=1.0, help='rate-limit window in seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 5, 10])
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    for name, result in results:
+        report(name, result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Resident memory of member state for a synthetic deployment, MEMBER_CACHE=full vs lean.
+
+full: every member is a cached discord.Member, as after chunking all guilds at startup.
+lean: only members who joined during the session are cached; verified state is the
+      per-guild array('Q') of VerifiedMemberIndex.
+set:  reference point, verified IDs as a Python set of ints instead of an array.
+
+Each mode runs in its own subprocess so peak RSS is not shared between them.
+
+    python benchmarks/bench_member_memory.py --members 1000000 --guilds 10
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+import bot  # noqa: E402
+from discord.state import ConnectionState  # noqa: E402
+
+MODES = ('full', 'lean', 'set')
+VERIFIED_ROLE_ID = 2
+SNOWFLAKE_START = 175928847299117063 # 2016
+SNOWFLAKE_STRIDE = 1 << 30
+
+
+def peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # KB on Linux
+
+
+def member_ids(guild_index: int, count: int, rng: random.Random):
+    """Ascending, unique snowflakes, one stride apart with jitter."""
+    base = SNOWFLAKE_START + guild_index * count * SNOWFLAKE_STRIDE
+    return [base + i * SNOWFLAKE_STRIDE + rng.randrange(SNOWFLAKE_STRIDE) for i in range(count)]
+
+
+def make_guild(state: ConnectionState, guild_id: int) -> bot.discord.Guild:
+    everyone = {'id': str(guild_id), 'name': '@everyone', 'permissions': '0', 'position': 0,
+                'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}
+    verified = dict(everyone, id=str(VERIFIED_ROLE_ID), name=bot.VERIFIED_ROLE_NAME, position=1)
+    return bot.discord.Guild(data={'id': str(guild_id), 'name': f'guild{guild_id}', 'roles': [everyone, verified]}, state=state)
+
+
+def cache_member(state: ConnectionState, guild, member_id: int, verified: bool):
+    data = {'user': {'id': str(member_id), 'username': f'user{member_id}', 'discriminator': '0', 'avatar': None, 'global_name': None},
+            'roles': [str(VERIFIED_ROLE_ID)] if verified else [], 'joined_at': '2024-01-01T00:00:00+00:00',
+            'deaf': False, 'mute': False, 'flags': 0}
+    guild._add_member(bot.discord.Member(data=data, guild=guild, state=state))
+
+
+def run_mode(args) -> dict:
+    """Builds one mode's member state and returns its measurements."""
+    rng = random.Random(args.seed)
+    state = ConnectionState(dispatch=lambda *_: None, handlers={}, hooks={}, http=None)
+    per_guild = args.members // args.guilds
+    guilds, verified_sets = [], {} # verified_sets: guild_id -> set of IDs, set mode only
+    baseline = peak_rss_bytes()
+    started = time.perf_counter()
+    verified_total = cached_total = 0
+    for guild_index in range(args.guilds):
+        guild = make_guild(state, guild_index + 1)
+        guilds.append(guild)
+        ids = member_ids(guild_index, per_guild, rng)
+        verified = [rng.random() < args.verified_ratio for _ in ids]
+        verified_total += sum(verified)
+        if args.mode == 'full':
+            for member_id, is_verified in zip(ids, verified):
+                cache_member(state, guild, member_id, is_verified)
+            cached_total += per_guild
+        else:
+            joined = max(1, int(per_guild * args.session_joins))
+            for member_id, is_verified in zip(ids[-joined:], verified[-joined:]):
+                cache_member(state, guild, member_id, is_verified)
+            cached_total += joined
+        if args.mode == 'set':
+            verified_sets[guild.id] = {member_id for member_id, is_verified in zip(ids, verified) if is_verified}
+            continue
+        # Catch-up builds the index a page at a time from the sorted member merge.
+        bot.verified_index.begin_rebuild(guild.id)
+        for i in range(0, per_guild, bot.CATCHUP_PAGE_SIZE):
+            page = ids[i:i + bot.CATCHUP_PAGE_SIZE]
+            bot.verified_index.extend_rebuild(guild.id, [member_id for member_id, is_verified in zip(page, verified[i:i + bot.CATCHUP_PAGE_SIZE]) if is_verified], page[-1])
+        bot.verified_index.finish_rebuild(guild.id)
+        del ids, verified
+    build_s = time.perf_counter() - started
+    resident = peak_rss_bytes() - baseline
+
+    probes = [(guild.id, SNOWFLAKE_START + rng.randrange(args.members * SNOWFLAKE_STRIDE)) for guild in guilds for _ in range(10_000)]
+    started = time.perf_counter()
+    if args.mode == 'set':
+        for guild_id, member_id in probes:
+            _ = member_id in verified_sets[guild_id]
+    else:
+        for guild_id, member_id in probes:
+            bot.verified_index.contains(guild_id, member_id)
+    lookup_ns = (time.perf_counter() - started) / len(probes) * 1e9
+
+    return {'mode': args.mode, 'members': per_guild * args.guilds, 'verified': verified_total, 'cached': cached_total,
+            'resident': resident, 'index': bot.verified_index.memory_bytes(), 'build_s': build_s, 'lookup_ns': lookup_ns}
+
+
+def report(result: dict):
+    mb = 1024 * 1024
+    print(f"{result['mode']:<5} members={result['members']} verified={result['verified']} cached_members={result['cached']} "
+          f"resident=+{result['resident'] / mb:.0f}MB ({result['resident'] / result['members']:.0f} B/member) "
+          f"verified_index={result['index'] / mb:.1f}MB build={result['build_s']:.1f}s lookup={result['lookup_ns']:.0f}ns")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--members', type=int, default=1_000_000, help='total members across all guilds')
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--verified-ratio', type=float, default=0.8)
+    parser.add_argument('--session-joins', type=float, default=0.01, help='fraction of members that joined while online (cached in lean mode)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS) # Set on the per-mode subprocess
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args)))
+        return
+    for mode in args.modes:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], '--mode', mode],
+                                check=True, capture_output=True, text=True).stdout
+        report(json.loads(output.splitlines()[-1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""Replays a gateway event trace against bot.py's handlers, fully offline.
+
+A trace is a JSON-lines file with one event per line:
+
+    {"type": "startup", "guild": 0, "members": 100000, "verified_ratio": 0.8, "recent_ratio": 0.01, "new_account_ratio": 0.1}
+    {"type": "join", "t": 0.01, "guild": 0, "member": 1428529137089252285}
+    {"type": "verify", "t": 0.50, "guild": 0, "member": 1428529137089252285}
+    {"type": "unverify" | "leave", "t": ..., "guild": 0, "member": ...}
+
+"startup" events describe the guilds present when the bot starts. They are built
+before on_ready runs, so the catch-up is measured on its own. The other events
+are then dispatched to the handlers as tasks, the way discord.py does. Without
+--trace a synthetic trace is generated (see --scenario). --save-trace writes it
+out so a run can be repeated exactly. The REST layer is simulated
+(fake_discord.FakeRest) with configurable latency and 429s.
+
+    python benchmarks/bench_replay.py --scenario startup --members 500000
+    python benchmarks/bench_replay.py --scenario live --guilds 5 --events 20000 --burst 200
+    python benchmarks/bench_replay.py --trace trace.jsonl --latency 0.05 --limit 20 --tracemalloc
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+# Shortened so pending checks, message batches and raids settle within the run.
+os.environ.setdefault('VERIFICATION_TIMEOUT_SECONDS', '2')
+os.environ.setdefault('MESSAGE_BATCH_WINDOW_SECONDS', '0.5')
+os.environ.setdefault('RAID_COOLDOWN_SECONDS', '2')
+import bot  # noqa: E402
+from fake_discord import FakeClient, FakeRest, snowflake_for  # noqa: E402
+
+WELCOME_CHANNEL_ID = 1
+WRITE_PREFIXES = ('_apply', '_write', '_update', '_delete')
+
+
+class CountingDB(bot.VerificationDB):
+    """VerificationDB that counts store operations and the rows passed to them."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.calls = collections.Counter()
+        self.rows = collections.Counter()
+
+    def _count(self, fn, args):
+        self.calls[fn.__name__] += 1
+        self.rows[fn.__name__] += sum(len(arg) for arg in args if isinstance(arg, list))
+
+    async def run(self, fn, *args):
+        self._count(fn, args)
+        return await super().run(fn, *args)
+
+    def run_blocking(self, fn, *args):
+        self._count(fn, args)
+        return super().run_blocking(fn, *args)
+
+
+def synthetic_trace(args) -> list[dict]:
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    trace = []
+    if args.scenario in ('startup', 'mixed'):
+        for guild in range(args.guilds):
+            trace.append({'type': 'startup', 'guild': guild, 'members': args.members, 'verified_ratio': 0.8,
+                          'recent_ratio': 0.01, 'new_account_ratio': 0.1})
+    if args.scenario in ('live', 'mixed'):
+        unverified = [[] for _ in range(args.guilds)]
+        verified = [[] for _ in range(args.guilds)]
+        t = 0.0
+        burst_at = args.events // 2 if args.burst else -1
+        for i in range(args.events):
+            t += rng.expovariate(args.rate)
+            if i == burst_at: # A raid: many new accounts joining one guild at once
+                for _ in range(args.burst):
+                    member_id = snowflake_for(now - timedelta(days=rng.uniform(0, 30)))
+                    trace.append({'type': 'join', 't': t, 'guild': 0, 'member': member_id})
+                    unverified[0].append(member_id)
+            guild = rng.randrange(args.guilds)
+            roll = rng.random()
+            if roll < 0.5 or not (unverified[guild] or verified[guild]):
+                member_id = snowflake_for(now - timedelta(days=rng.uniform(0, 730)))
+                trace.append({'type': 'join', 't': t, 'guild': guild, 'member': member_id})
+                unverified[guild].append(member_id)
+            elif roll < 0.75 and unverified[guild]:
+                member_id = unverified[guild].pop(rng.randrange(len(unverified[guild])))
+                trace.append({'type': 'verify', 't': t, 'guild': guild, 'member': member_id})
+                verified[guild].append(member_id)
+            elif roll < 0.8 and verified[guild]:
+                member_id = verified[guild].pop(rng.randrange(len(verified[guild])))
+                trace.append({'type': 'unverify', 't': t, 'guild': guild, 'member': member_id})
+                unverified[guild].append(member_id)
+            else:
+                pool = verified[guild] if verified[guild] and rng.random() < 0.5 else unverified[guild] or verified[guild]
+                member_id = pool.pop(rng.randrange(len(pool)))
+                trace.append({'type': 'leave', 't': t, 'guild': guild, 'member': member_id})
+    return trace
+
+
+def load_trace(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_trace(path: str, trace: list[dict]):
+    with open(path, 'w') as f:
+        for event in trace:
+            f.write(json.dumps(event) + '\n')
+
+
+def populate(guild, event: dict, rng: random.Random):
+    """Builds the member list a "startup" event describes."""
+    for _ in range(event['members']):
+        recent = rng.random() < event.get('recent_ratio', 0.0)
+        guild.add_member(account_age_days=rng.uniform(0, 30) if rng.random() < event.get('new_account_ratio', 0.0) else rng.uniform(91, 730),
+                         verified=rng.random() < event.get('verified_ratio', 0.0),
+                         joined_ago_seconds=rng.uniform(0, 60) if recent else rng.uniform(86400, 86400 * 365))
+
+
+def percentile(samples: list[float], q: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * q))] if samples else 0.0
+
+
+async def drain(timeout: float):
+    """Waits for kicks, pending verification checks and queued messages to finish."""
+    deadline = time.monotonic() + timeout
+    await bot.kick_executor.join()
+    while (len(bot.verification_scheduler) or bot.message_dispatcher.pending() or bot.raid_monitor._raids) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    await bot.kick_executor.join()
+    await bot.flush_write_buffers()
+    await bot.verification_scheduler.persist()
+
+
+async def replay(trace: list[dict], args) -> dict:
+    rng = random.Random(args.seed)
+    rest = FakeRest(args.latency, args.limit, args.window)
+    client = FakeClient(rest)
+    bot.client = client
+    bot.WELCOME_CHANNEL_ID = WELCOME_CHANNEL_ID
+    bot.db = CountingDB(os.path.join(tempfile.mkdtemp(), 'replay.db'))
+    guilds = {}
+
+    def guild_for(index: int):
+        if index not in guilds:
+            guilds[index] = client.add_guild()
+            # Every fake guild gets WELCOME_CHANNEL_ID. The dispatcher queues per channel ID, so
+            # their messages coalesce as if they all went to one busy channel.
+            guilds[index].add_text_channel('welcome', WELCOME_CHANNEL_ID)
+        return guilds[index]
+
+    startup_events = [event for event in trace if event['type'] == 'startup']
+    live_events = sorted((event for event in trace if event['type'] != 'startup'), key=lambda event: event.get('t', 0.0))
+    for event in startup_events:
+        populate(guild_for(event['guild']), event, rng)
+    for event in live_events:
+        guild_for(event['guild'])
+    member_total = sum(guild.member_count for guild in guilds.values())
+
+    started = time.perf_counter()
+    await bot.on_ready()
+    startup_elapsed = time.perf_counter() - started
+    startup_db_calls = sum(bot.db.calls.values())
+
+    latencies = collections.defaultdict(list)
+    skipped = 0
+
+    async def measure(kind: str, coro):
+        handler_started = time.perf_counter()
+        await coro
+        latencies[kind].append(time.perf_counter() - handler_started)
+
+    tasks = []
+    started = time.perf_counter()
+    for event in live_events:
+        if args.realtime:
+            await asyncio.sleep(max(0.0, started + event['t'] - time.perf_counter()))
+        guild = guilds[event['guild']]
+        kind = event['type']
+        if kind == 'join':
+            coro = bot.on_member_join(guild.add_member(member_id=event['member']))
+        elif kind in ('verify', 'unverify'):
+            pair = guild.set_verified(event['member'], kind == 'verify')
+            coro = bot.on_member_update(*pair) if pair else None
+        elif kind == 'leave':
+            member = guild.remove_member(event['member'])
+            coro = bot.on_member_remove(member) if member else None
+        else:
+            raise ValueError(f"Unknown event type {kind!r}")
+        if coro is None: # The member was already kicked
+            skipped += 1
+            continue
+        tasks.append(asyncio.create_task(measure(kind, coro)))
+        await asyncio.sleep(0) # Let the handlers run between gateway events
+    await asyncio.gather(*tasks)
+    await drain(args.drain_timeout)
+    live_elapsed = time.perf_counter() - started
+
+    return {
+        'guilds': len(guilds), 'members': member_total, 'startup_s': startup_elapsed, 'startup_db_calls': startup_db_calls,
+        'events': len(tasks), 'skipped': skipped, 'live_s': live_elapsed, 'latencies': latencies, 'rest': rest,
+        'db_calls': bot.db.calls, 'db_rows': bot.db.rows,
+        'messages': sum(len(channel.sent) for guild in guilds.values() for channel in guild.text_channels),
+        'dispatched': collections.Counter(event for event, _ in client.dispatched),
+    }
+
+
+def report(result: dict):
+    print(f"startup    guilds={result['guilds']} members={result['members']} on_ready={result['startup_s']:.2f}s "
+          f"({result['members'] / max(result['startup_s'], 1e-9):.0f} members/s) db_calls={result['startup_db_calls']}")
+    print(f"live       events={result['events']} skipped={result['skipped']} elapsed={result['live_s']:.2f}s "
+          f"throughput={result['events'] / max(result['live_s'], 1e-9):.0f} events/s")
+    for kind, samples in sorted(result['latencies'].items()):
+        samples.sort()
+        print(f"  {kind:<9}n={len(samples)} p50={statistics.median(samples) * 1000:.2f}ms "
+              f"p99={percentile(samples, 0.99) * 1000:.2f}ms max={samples[-1] * 1000:.2f}ms")
+    rest = result['rest']
+    print(f"rest       calls={dict(rest.calls)} 429s={rest.rate_limited}")
+    writes = {name: count for name, count in result['db_calls'].items() if name.startswith(WRITE_PREFIXES)}
+    print(f"db         operations={sum(result['db_calls'].values())} write_transactions={sum(writes.values())} "
+          f"rows_written={sum(result['db_rows'][name] for name in writes)}")
+    print(f"messages   sent={result['messages']} events={dict(result['dispatched'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trace', help='JSON-lines trace to replay instead of a synthetic one')
+    parser.add_argument('--save-trace', help='Write the trace that was replayed to this file')
+    parser.add_argument('--scenario', choices=('startup', 'live', 'mixed'), default='mixed')
+    parser.add_argument('--guilds', type=int, default=1)
+    parser.add_argument('--members', type=int, default=10_000, help='Members per guild at startup')
+    parser.add_argument('--events', type=int, default=5_000, help='Live events after startup')
+    parser.add_argument('--rate', type=float, default=200.0, help='Average live events per second of trace time')
+    parser.add_argument('--burst', type=int, default=0, help='Add a raid of this many new-account joins mid-trace')
+    parser.add_argument('--realtime', action='store_true', help='Honour event timestamps instead of replaying as fast as possible')
+    parser.add_argument('--latency', type=float, default=0.0, help='Simulated REST latency in seconds')
+    parser.add_argument('--limit', type=int, default=0, help='REST calls per route per window before 429s (0 = unlimited)')
+    parser.add_argument('--window', type=float, default=1.0)
+    parser.add_argument('--drain-timeout', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tracemalloc', action='store_true', help='Also report the peak traced Python allocation (slower)')
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace) if args.trace else synthetic_trace(args)
+    if args.save_trace:
+        save_trace(args.save_trace, trace)
+    if args.tracemalloc:
+        tracemalloc.start()
+    result = asyncio.run(replay(trace, args))
+    report(result)
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KiB on Linux
+    line = f"memory     peak_rss={peak_rss_mb:.0f}MB"
+    if args.tracemalloc:
+        line += f" tracemalloc_peak={tracemalloc.get_traced_memory()[1] / 2**20:.0f}MB"
+    print(line)
+    bot.db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""Offline stand-ins for the discord.py objects bot.py touches.
+
+``FakeRest`` simulates the REST layer with per-route latency and a fixed-window
+rate limit that raises ``discord.RateLimited`` (a 429) once the window is spent,
+so throughput can be measured without a network or a bot token.
+"""
+import asyncio
+import collections
+import copy
+import itertools
+import time
+import types
+from datetime import datetime, timedelta, timezone
+
+import discord
+
+DISCORD_EPOCH_MS = 1420070400000
+_ids = itertools.count(1)
+
+
+def snowflake_for(created_at: datetime) -> int:
+    """Builds a unique snowflake whose embedded timestamp is created_at."""
+    return (int(created_at.timestamp() * 1000) - DISCORD_EPOCH_MS) << 22 | (next(_ids) & 0x3FFFFF)
+
+
+def fake_response(status: int, reason: str):
+    return types.SimpleNamespace(status=status, reason=reason, headers={})
+
+
+class FakeRest:
+    """Simulated REST layer. Each route gets `limit` calls per `window` seconds; further calls
+    raise discord.RateLimited until the window resets."""
+
+    def __init__(self, latency: float = 0.02, limit: int = 10, window: float = 1.0):
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.calls = collections.Counter()
+        self.rate_limited = 0
+        self._windows = {} # route -> (window_start, used)
+
+    async def request(self, route: str, bucket=None):
+        await asyncio.sleep(self.latency)
+        key = (route, bucket)
+        now = time.monotonic()
+        start, used = self._windows.get(key, (now, 0))
+        if now - start >= self.window:
+            start, used = now, 0
+        if self.limit and used >= self.limit:
+            self.rate_limited += 1
+            raise discord.RateLimited(start + self.window - now)
+        self._windows[key] = (start, used + 1)
+        self.calls[route] += 1
+
+
+class FakeRole:
+    def __init__(self, role_id: int, name: str):
+        self.id = role_id
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.discriminator = '0'
+        self.mention = f'<@{user_id}>'
+        self.bot = False
+
+
+class FakeMember(FakeUser):
+    def __init__(self, guild: 'FakeGuild', member_id: int, roles=(), joined_at: datetime | None = None, bot: bool = False):
+        super().__init__(member_id, f'user{member_id}')
+        self.guild = guild
+        self.roles = list(roles)
+        self.joined_at = joined_at or datetime.now(timezone.utc)
+        self.created_at = discord.utils.snowflake_time(member_id)
+        self.bot = bot
+
+    def get_role(self, role_id: int):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+    async def kick(self, reason: str | None = None):
+        await self.guild.rest.request('kick', self.guild.id)
+        if self.guild.remove_member(self.id) is None:
+            raise discord.NotFound(fake_response(404, 'Not Found'), 'Unknown Member')
+
+
+class FakeTextChannel(discord.TextChannel):
+    """Passes the bot's isinstance(..., discord.TextChannel) checks and records sent messages."""
+
+    def __init__(self, guild: 'FakeGuild', channel_id: int, name: str):
+        self.guild = guild
+        self.id = channel_id
+        self.name = name
+        self.sent = []
+
+    async def send(self, content: str):
+        await self.guild.rest.request('send', self.id)
+        self.sent.append(content)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, rest: FakeRest, name: str | None = None, verified_role_name: str = 'verified'):
+        self.id = guild_id
+        self.name = name or f'guild{guild_id}'
+        self.rest = rest
+        self.verified_role = FakeRole(next(_ids), verified_role_name)
+        self.roles = [FakeRole(next(_ids), '@everyone'), self.verified_role]
+        self.text_channels = []
+        self.chunked = True
+        self.shard_id = 0
+        self._members = {}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def member_count(self):
+        return len(self._members)
+
+    def add_text_channel(self, name: str, channel_id: int | None = None) -> FakeTextChannel:
+        channel = FakeTextChannel(self, channel_id or next(_ids), name)
+        self.text_channels.append(channel)
+        return channel
+
+    def get_channel(self, channel_id: int):
+        return next((c for c in self.text_channels if c.id == channel_id), None)
+
+    def get_member(self, member_id: int):
+        return self._members.get(member_id)
+
+    def add_member(self, account_age_days: float = 365, verified: bool = False, joined_ago_seconds: float = 0, bot: bool = False,
+                   member_id: int | None = None) -> FakeMember:
+        now = datetime.now(timezone.utc)
+        if member_id is None:
+            member_id = snowflake_for(now - timedelta(days=account_age_days))
+        roles = [self.verified_role] if verified else []
+        member = FakeMember(self, member_id, roles, now - timedelta(seconds=joined_ago_seconds), bot)
+        self._members[member_id] = member
+        return member
+
+    def remove_member(self, member_id: int):
+        return self._members.pop(member_id, None)
+
+    def set_verified(self, member_id: int, verified: bool):
+        """Adds or removes the verified role and returns the (before, after) pair an
+        on_member_update event carries, or None if the member is not in the guild."""
+        member = self._members.get(member_id)
+        if member is None:
+            return None
+        before = copy.copy(member)
+        before.roles = list(member.roles)
+        if verified and self.verified_role not in member.roles:
+            member.roles.append(self.verified_role)
+        elif not verified and self.verified_role in member.roles:
+            member.roles.remove(self.verified_role)
+        return before, member
+
+    async def fetch_member(self, member_id: int):
+        await self.rest.request('fetch_member', self.id)
+        member = self._members.get(member_id)
+        if member is None:
+            raise discord.NotFound(fake_response(404, 'Not Found'), 'Unknown Member')
+        return member
+
+    async def fetch_members(self, limit=None):
+        # Like discord.py over the real endpoint: pages of 1000 cover ascending user ID ranges,
+        # but each page is yielded in reverse.
+        members = sorted(self._members.values(), key=lambda member: member.id)
+        for i in range(0, len(members), 1000):
+            await self.rest.request('fetch_members', self.id)
+            for member in reversed(members[i:i + 1000]):
+                yield member
+
+
+class FakeClient:
+    def __init__(self, rest: FakeRest):
+        self.rest = rest
+        self.guilds = []
+        self.user = FakeUser(0, 'bot')
+        self.dispatched = [] # (event, args) of custom events the bot dispatched
+
+    def dispatch(self, event: str, *args):
+        self.dispatched.append((event, args))
+
+    def add_guild(self, guild_id: int | None = None, **kwargs) -> FakeGuild:
+        guild = FakeGuild(guild_id or next(_ids), self.rest, **kwargs)
+        self.guilds.append(guild)
+        return guild
+
+    def get_guild(self, guild_id: int):
+        return next((g for g in self.guilds if g.id == guild_id), None)
+
+    def get_user(self, user_id: int):
+        return None
+
+    async def fetch_user(self, user_id: int):
+        await self.rest.request('fetch_user')
+        return FakeUser(user_id, f'user{user_id}')
+
+    async def change_presence(self, **kwargs):
+        pass
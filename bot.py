@@ -1,7 +1,24 @@
 import discord
 import os
+import abc
 import asyncio
+import bisect
+import functools
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import signal
+import string
+import collections
+import heapq
+import time
+import socket
 import sqlite3 # For persistent storage
+import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 # --- Configuration ---
@@ -19,12 +36,447 @@ GOODBYE_MESSAGE = os.getenv('GOODBYE_MESSAGE', '**{member_name}** just left **{g
 QUICK_LEAVE_TIMEOUT_SECONDS = int(os.getenv('QUICK_LEAVE_TIMEOUT_SECONDS', '600')) # 10 minutes
 QUICK_LEAVE_GOODBYE_MESSAGE = os.getenv('QUICK_LEAVE_GOODBYE_MESSAGE', '**{member_name}** just left **{guild_name}**.') # Optional special message for quick leavers
 BATCH_GOODBYE_MESSAGE = os.getenv('BATCH_GOODBYE_MESSAGE', 'While the bot was offline, the following members left: **{member_names_list}**.')
+LIVE_BATCH_WELCOME_MESSAGE = os.getenv('LIVE_BATCH_WELCOME_MESSAGE', 'Welcome {member_mentions_list} to **{guild_name}**!') # Welcomes combined while online
+LIVE_BATCH_GOODBYE_MESSAGE = os.getenv('LIVE_BATCH_GOODBYE_MESSAGE', '**{member_names_list}** just left **{guild_name}**.') # Goodbyes combined while online
+MESSAGE_BATCH_WINDOW_SECONDS = float(os.getenv('MESSAGE_BATCH_WINDOW_SECONDS', '3')) # Welcomes/goodbyes arriving within this window are combined into one message
+KICK_CONCURRENCY = int(os.getenv('KICK_CONCURRENCY', '5')) # Parallel kick requests per guild
+CHECKPOINT_INTERVAL_SECONDS = float(os.getenv('CHECKPOINT_INTERVAL_SECONDS', '30')) # How often each live guild's last-processed time is saved
+CATCHUP_CONCURRENCY = int(os.getenv('CATCHUP_CONCURRENCY', '4')) # Guilds caught up in parallel on startup (they share one REST rate-limit budget)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper() # DEBUG adds per-member lines during catch-up
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower() # 'text' or 'json'
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0')) # Serve Prometheus metrics on this port (0 = disabled)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_DUMP_PATH = os.getenv('METRICS_DUMP_PATH', None) # Optionally write the metrics text to this file periodically
+METRICS_DUMP_SECONDS = float(os.getenv('METRICS_DUMP_SECONDS', '60'))
+WRITE_BUFFER_MAX_SIZE = int(os.getenv('WRITE_BUFFER_MAX_SIZE', '500')) # Pending verified_members writes before a forced flush
+WRITE_BUFFER_FLUSH_SECONDS = float(os.getenv('WRITE_BUFFER_FLUSH_SECONDS', '2')) # Maximum time a write stays buffered
+RAID_JOIN_THRESHOLD = int(os.getenv('RAID_JOIN_THRESHOLD', '10')) # Joins within RAID_WINDOW_SECONDS that switch a guild into raid mode (0 = disabled)
+RAID_WINDOW_SECONDS = float(os.getenv('RAID_WINDOW_SECONDS', '10'))
+RAID_COOLDOWN_SECONDS = float(os.getenv('RAID_COOLDOWN_SECONDS', '60')) # Raid mode ends once the threshold has not been hit for this long
+RAID_MIN_ACCOUNT_AGE_DAYS = int(os.getenv('RAID_MIN_ACCOUNT_AGE_DAYS', MIN_ACCOUNT_AGE_DAYS * 2)) # Stricter age screening while in raid mode
+GUILD_CONFIG_PATH = os.getenv('GUILD_CONFIG_PATH', None) # Optional JSON file of per-guild overrides, watched and loaded into the guild_config table
+GUILD_CONFIG_POLL_SECONDS = float(os.getenv('GUILD_CONFIG_POLL_SECONDS', '5')) # How often GUILD_CONFIG_PATH is checked for changes
+SHARD_COUNT = os.getenv('SHARD_COUNT', '').lower() # '' = single unsharded client, 'auto' = Discord's recommended count, or a number
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv('SHARD_IDS', '').split(',') if shard_id.strip()] # Shards run by this process (one process per shard cluster); needs a numeric SHARD_COUNT
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'sqlite').lower() # 'sqlite' (local file) or 'remote' (shared state server)
+STATE_STORE_ADDRESS = os.getenv('STATE_STORE_ADDRESS', '127.0.0.1:8765') # host:port of the state server for the remote backend
+MEMBER_CACHE = os.getenv('MEMBER_CACHE', 'full').lower() # 'full' caches every member, 'lean' only members who join while online plus pending newcomers
+
+# --- Logging ---
+class CachedTimeFormatter(logging.Formatter):
+    """Formats lines as '[timestamp] LEVEL message' (or one JSON object per line). The timestamp
+    string is only rebuilt when the second changes, not for every line."""
+
+    def __init__(self, json_output: bool = False):
+        super().__init__()
+        self.json_output = json_output
+        self._cached_second = None
+        self._cached_time = ''
+
+    def formatTime(self, record: logging.LogRecord, datefmt: str | None = None) -> str:
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_time = time.strftime('%Y-%m-%d %H:%M:%S UTC', time.gmtime(second))
+        return self._cached_time
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if record.exc_info:
+            message = f"{message}\n{self.formatException(record.exc_info)}"
+        if self.json_output:
+            return json.dumps({'time': self.formatTime(record), 'level': record.levelname, 'logger': record.name, 'message': message})
+        return f"[{self.formatTime(record)}] {record.levelname} {message}"
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Routes the bot's and discord.py's logs through a queue so formatting and stdout writes
+    happen on a background thread instead of the event loop."""
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(CachedTimeFormatter(json_output=LOG_FORMAT == 'json'))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    for name, level in (('welcome_bot', LOG_LEVEL), ('discord', logging.INFO)):
+        logger = logging.getLogger(name)
+        logger.addHandler(queue_handler)
+        logger.setLevel(level)
+        logger.propagate = False
+    listener.start()
+    atexit.register(listener.stop) # Drains anything still queued on exit
+    return listener
+
+log_listener = setup_logging()
+log = logging.getLogger('welcome_bot')
+# Per-member lines are written as `if DEBUG_LOGGING: log.debug(f"...")` so the f-string is never built when disabled.
+DEBUG_LOGGING = log.isEnabledFor(logging.DEBUG)
+
+# --- Metrics ---
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Metric:
+    """Minimal Prometheus-style metric family. Recording only touches plain numbers; all text
+    rendering happens at scrape time."""
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def clear(self):
+        self._children.clear()
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    class _Child:
+        __slots__ = ('value',)
+        def __init__(self): self.value = 0.0
+        def inc(self, amount: float = 1.0): self.value += amount
+
+    _new_child = _Child
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {child.value}']
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    class _Child(Counter._Child):
+        __slots__ = ()
+        def set(self, value: float): self.value = value
+
+    _new_child = _Child
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = buckets
+
+    class _Child:
+        __slots__ = ('buckets', 'counts', 'sum', 'count')
+        def __init__(self, buckets):
+            self.buckets = buckets
+            self.counts = [0] * (len(buckets) + 1)
+            self.sum = 0.0
+            self.count = 0
+        def observe(self, value: float):
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def _new_child(self):
+        return Histogram._Child(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {child.sum}')
+        lines.append(f'{self.name}_count{labels} {child.count}')
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = [] # Callables refreshing gauges right before a scrape
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                log.error(f"Metrics collector {collector.__name__} failed: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+HANDLER_LATENCY = metrics.register(Histogram('welcome_bot_handler_seconds', 'Event handler latency.', ('handler',)))
+DB_STATEMENT_SECONDS = metrics.register(Histogram('welcome_bot_db_statement_seconds', 'Time spent executing SQLite work on the DB thread.', ('operation',)))
+PENDING_VERIFICATIONS = metrics.register(Gauge('welcome_bot_pending_verifications', 'Pending verification checks.'))
+PENDING_VERIFICATION_AGE = metrics.register(Histogram('welcome_bot_pending_verification_age_seconds', 'Time pending verification checks have been waiting.', buckets=DURATION_BUCKETS))
+PENDING_VERIFICATION_MEMORY = metrics.register(Gauge('welcome_bot_pending_verification_memory_bytes', 'Approximate memory held by the pending verification index.'))
+VERIFIED_INDEX_MEMORY = metrics.register(Gauge('welcome_bot_verified_index_memory_bytes', 'Memory held by the in-memory verified member ID arrays.'))
+KICKS = metrics.register(Counter('welcome_bot_kicks_total', 'Kick attempts by result.', ('result',)))
+KICK_QUEUE_DEPTH = metrics.register(Gauge('welcome_bot_kick_queue_depth', 'Kicks waiting in the per-guild pipelines.'))
+MESSAGE_SEND_SECONDS = metrics.register(Histogram('welcome_bot_message_send_seconds', 'Latency of welcome/goodbye channel sends.'))
+CATCHUP_DURATION = metrics.register(Gauge('welcome_bot_catchup_duration_seconds', 'Duration of the last catch-up per guild.', ('guild_id',)))
+RAID_MODE = metrics.register(Gauge('welcome_bot_raid_mode', 'Whether a guild is in raid mode (1) or not (0).', ('guild_id',)))
+RAID_TRANSITIONS = metrics.register(Counter('welcome_bot_raid_mode_transitions_total', 'Raid mode transitions.', ('transition',)))
+EVENT_LOOP_LAG = metrics.register(Histogram('welcome_bot_event_loop_lag_seconds', 'How late a periodic 1s timer fires on the event loop.'))
+
+def instrument_handler(fn):
+    """Records the wrapped event handler's latency in HANDLER_LATENCY."""
+    histogram = HANDLER_LATENCY.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+async def monitor_event_loop_lag(interval: float = 1.0):
+    loop = asyncio.get_running_loop()
+    histogram = EVENT_LOOP_LAG.labels()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        histogram.observe(max(0.0, loop.time() - expected))
+
+async def _handle_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''): # Skip headers
+            pass
+        if request_line.split(b' ')[1:2] == [b'/metrics']:
+            body, status = metrics.render().encode(), '200 OK'
+        else:
+            body, status = b'Not Found\n', '404 Not Found'
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+        await writer.drain()
+    except Exception as e:
+        log.error(f"Error serving metrics request: {e}")
+    finally:
+        writer.close()
+
+async def dump_metrics_periodically(path: str, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        text = metrics.render()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, functools.partial(_write_text_file, path, text))
+        except OSError as e:
+            log.error(f"Error writing metrics dump to {path}: {e}")
+
+def _write_text_file(path: str, text: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+metrics_tasks = []
+
+async def start_metrics():
+    """Starts the metrics endpoint, the optional dump and the loop-lag monitor once, if enabled."""
+    if metrics_tasks or (not METRICS_PORT and not METRICS_DUMP_PATH):
+        return
+    metrics_tasks.append(asyncio.create_task(monitor_event_loop_lag()))
+    if METRICS_PORT:
+        server = await asyncio.start_server(_handle_metrics_request, METRICS_HOST, METRICS_PORT)
+        metrics_tasks.append(server)
+        log.info(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    if METRICS_DUMP_PATH:
+        metrics_tasks.append(asyncio.create_task(dump_metrics_periodically(METRICS_DUMP_PATH, METRICS_DUMP_SECONDS)))
 
 # --- Database Setup ---
-DB_NAME = 'verification_state.db'
+DB_NAME = os.getenv('DB_NAME', 'verification_state.db')
+
+class StateStoreError(sqlite3.Error):
+    """Raised by the remote backend. Subclasses sqlite3.Error so the existing DB error handling covers it."""
+
+store_operations = {} # name -> fn(conn, *args), the operations a remote state server will run
+
+def store_operation(fn):
+    store_operations[fn.__name__] = fn
+    return fn
+
+class StateStore(abc.ABC):
+    """Interface of the state backends. run(fn, *args) executes a registered store operation
+    fn(conn, *args) and returns its result. Arguments and results stay JSON-compatible so the
+    operation can run in another process; calls from one client are applied in order."""
+
+    path = None
+
+    @abc.abstractmethod
+    async def run(self, fn, *args):
+        ...
+
+    @abc.abstractmethod
+    def run_blocking(self, fn, *args):
+        """Same as run() but for callers outside the event loop (e.g. shutdown)."""
+
+    def close(self):
+        pass
+
+class VerificationDB(StateStore):
+    """Default backend. Owns one long-lived SQLite connection (WAL mode) that is only ever touched from a
+    dedicated executor thread, so DB work never blocks the discord.py event loop."""
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='verification-db')
+
+    def _connection(self) -> sqlite3.Connection:
+        # Only called from the executor thread.
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        return self._conn
+
+    async def run(self, fn, *args):
+        """Runs fn(conn, *args) on the DB thread and returns its result."""
+        loop = asyncio.get_running_loop()
+        result, elapsed = await loop.run_in_executor(self._executor, self._timed, fn, args)
+        DB_STATEMENT_SECONDS.labels(fn.__name__).observe(elapsed) # Recorded on the loop thread
+        return result
+
+    def run_blocking(self, fn, *args):
+        return self._executor.submit(self._timed, fn, args).result()[0]
+
+    def _timed(self, fn, args):
+        started = time.perf_counter()
+        result = fn(self._connection(), *args)
+        return result, time.perf_counter() - started
+
+    def close(self):
+        def _close(conn):
+            conn.close()
+            self._conn = None
+        if self._conn is not None:
+            self.run_blocking(_close)
+        self._executor.shutdown(wait=True)
+
+STORE_MESSAGE_LIMIT = 64 * 1024 * 1024 # Longest request/response line on the state server protocol
+
+def _encode_store_request(fn, args) -> bytes:
+    return json.dumps({'op': fn.__name__, 'args': args}).encode() + b'\n'
+
+def _decode_store_response(line: bytes):
+    response = json.loads(line)
+    if 'error' in response:
+        raise StateStoreError(response['error'])
+    return response['result']
+
+class RemoteStateStore(StateStore):
+    """Networked backend for sharded deployments: every process talks to one state server
+    (serve_state_store) that owns the SQLite file. Requests are newline-delimited JSON over a
+    single persistent connection and are sent one at a time, which keeps the same ordering
+    guarantee as the local single-threaded backend."""
+
+    def __init__(self, address: str):
+        host, _, port = address.rpartition(':')
+        self.path = address
+        self.host = host or '127.0.0.1'
+        self.port = int(port)
+        self._reader = None
+        self._writer = None
+        self._lock = None # Created on first use, inside the running loop
+
+    def _drop_connection(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def run(self, fn, *args):
+        request = _encode_store_request(fn, args)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        started = time.perf_counter()
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    self._reader, self._writer = await asyncio.open_connection(self.host, self.port, limit=STORE_MESSAGE_LIMIT)
+                self._writer.write(request)
+                await self._writer.drain()
+                line = await self._reader.readline()
+                if not line:
+                    raise ConnectionError('connection closed by state server')
+            except OSError as e:
+                self._drop_connection()
+                raise StateStoreError(f"State server {self.path} unavailable: {e}") from e
+        DB_STATEMENT_SECONDS.labels(fn.__name__).observe(time.perf_counter() - started) # Includes the round trip
+        return _decode_store_response(line)
+
+    def run_blocking(self, fn, *args):
+        try:
+            with socket.create_connection((self.host, self.port), timeout=10) as sock:
+                sock.sendall(_encode_store_request(fn, args))
+                line = sock.makefile('rb').readline()
+        except OSError as e:
+            raise StateStoreError(f"State server {self.path} unavailable: {e}") from e
+        return _decode_store_response(line)
+
+    def close(self):
+        self._drop_connection()
+
+async def serve_state_store(store: StateStore, host: str, port: int) -> asyncio.AbstractServer:
+    """Serves store operations to RemoteStateStore clients. Returns the started server; port 0
+    picks a free port, which is how tests and benchmarks run a local stand-in."""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                    response = {'result': await store.run(store_operations[request['op']], *request['args'])}
+                except (KeyError, TypeError, ValueError, sqlite3.Error) as e:
+                    response = {'error': f"{type(e).__name__}: {e}"}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            log.warning(f"State server connection error: {e}")
+        finally:
+            writer.close()
+    server = await asyncio.start_server(handle, host, port, limit=STORE_MESSAGE_LIMIT)
+    log.info(f"State server listening on {', '.join(str(sock.getsockname()) for sock in server.sockets)} (DB '{store.path}').")
+    return server
+
+def create_state_store() -> StateStore:
+    if STATE_BACKEND == 'remote':
+        return RemoteStateStore(STATE_STORE_ADDRESS)
+    return VerificationDB(DB_NAME)
+
+db = create_state_store()
+
+@store_operation
+def _init_db(conn: sqlite3.Connection):
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS verified_members (
@@ -34,6 +486,51 @@ def init_db():
             PRIMARY KEY (guild_id, member_id)
         )
     ''')
+    # Compact membership snapshot used for startup reconciliation. verified mirrors
+    # verified_members; joined_at is a Unix timestamp (NULL if never observed).
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS member_snapshot (
+            guild_id INTEGER NOT NULL,
+            member_id INTEGER NOT NULL,
+            joined_at REAL,
+            verified INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, member_id)
+        ) WITHOUT ROWID
+    ''')
+    # First start with the snapshot table: seed it from verified_members so verified members
+    # who leave before the next full reconciliation still get their goodbye.
+    cursor.execute('''
+        INSERT INTO member_snapshot (guild_id, member_id, joined_at, verified)
+        SELECT guild_id, member_id, NULL, 1 FROM verified_members
+        WHERE NOT EXISTS (SELECT 1 FROM member_snapshot)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pending_verifications (
+            guild_id INTEGER NOT NULL,
+            member_id INTEGER NOT NULL,
+            deadline REAL NOT NULL,
+            waiting_since REAL,
+            PRIMARY KEY (guild_id, member_id)
+        )
+    ''')
+    # Databases from before waiting_since was tracked (NULL: estimated from the default timeout on load).
+    if 'waiting_since' not in {row[1] for row in cursor.execute('PRAGMA table_info(pending_verifications)')}:
+        cursor.execute('ALTER TABLE pending_verifications ADD COLUMN waiting_since REAL')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS guild_checkpoints (
+            guild_id INTEGER PRIMARY KEY,
+            shard_id INTEGER,
+            last_seen TEXT NOT NULL
+        )
+    ''')
+    # Per-guild overrides of the env settings, as a JSON object keyed by setting name.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS guild_config (
+            guild_id INTEGER PRIMARY KEY,
+            settings TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    ''')
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS bot_status (
             id INTEGER PRIMARY KEY,
@@ -41,478 +538,1986 @@ def init_db():
         )
     ''')
     conn.commit()
-    conn.close()
-    print(f"{get_log_prefix()} Database '{DB_NAME}' initialized.")
 
-def mark_member_verified_in_db(guild_id: int, member_id: int):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    try:
-        cursor.execute('''
-            INSERT OR REPLACE INTO verified_members (guild_id, member_id, verified_at)
-            VALUES (?, ?, ?)
-        ''', (guild_id, member_id, datetime.now(timezone.utc).isoformat()))
-        conn.commit()
-        print(f"{get_log_prefix()} Marked member {member_id} in guild {guild_id} as verified in DB.")
-    except sqlite3.Error as e:
-        print(f"{get_log_prefix()} DB_ERROR marking member {member_id} verified: {e}")
-    finally:
-        conn.close()
+async def init_db():
+    await db.run(_init_db)
+    log.info(f"State store '{db.path}' initialized ({STATE_BACKEND} backend).")
 
-def remove_member_from_db(guild_id: int, member_id: int):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    try:
-        cursor.execute('''
-            DELETE FROM verified_members
-            WHERE guild_id = ? AND member_id = ?
-        ''', (guild_id, member_id))
-        conn.commit()
-        # Only log if a row was actually deleted
-        if cursor.rowcount > 0:
-            print(f"{get_log_prefix()} Removed member {member_id} in guild {guild_id} from DB.")
-    except sqlite3.Error as e:
-        print(f"{get_log_prefix()} DB_ERROR removing member {member_id}: {e}")
-    finally:
-        conn.close()
+@store_operation
+def _apply_verified_member_writes(conn: sqlite3.Connection, upserts: list[tuple], deletes: list[tuple]):
+    with conn: # One transaction (and one fsync) for the whole batch
+        if upserts:
+            conn.executemany('''
+                INSERT OR REPLACE INTO verified_members (guild_id, member_id, verified_at)
+                VALUES (?, ?, ?)
+            ''', upserts)
+        if deletes:
+            conn.executemany('''
+                DELETE FROM verified_members
+                WHERE guild_id = ? AND member_id = ?
+            ''', deletes)
 
-def was_member_verified_in_db(guild_id: int, member_id: int) -> bool:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+@store_operation
+def _apply_member_snapshot_writes(conn: sqlite3.Connection, upserts: list[tuple], deletes: list[tuple]):
+    with conn:
+        if upserts:
+            conn.executemany('''
+                INSERT INTO member_snapshot (guild_id, member_id, joined_at, verified)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (guild_id, member_id) DO UPDATE SET
+                    joined_at = COALESCE(excluded.joined_at, member_snapshot.joined_at),
+                    verified = excluded.verified
+            ''', upserts)
+        if deletes:
+            conn.executemany('''
+                DELETE FROM member_snapshot
+                WHERE guild_id = ? AND member_id = ?
+            ''', deletes)
+
+class WriteBehindBuffer:
+    """Write-behind buffer for one table keyed by (guild_id, member_id). Upserts and deletes are
+    merged per key so only the last write survives, then flushed through apply_writes in a single
+    transaction once WRITE_BUFFER_MAX_SIZE or WRITE_BUFFER_FLUSH_SECONDS is hit."""
+
+    def __init__(self, name: str, apply_writes, max_size: int, flush_seconds: float):
+        self.name = name
+        self.apply_writes = apply_writes # fn(conn, upserts, deletes), run on the DB thread
+        self.max_size = max_size
+        self.flush_seconds = flush_seconds
+        self._pending = {} # (guild_id, member_id) -> row values, or None for a delete
+        self._flusher = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def _maybe_flush(self):
+        if len(self._pending) >= self.max_size:
+            await self.flush()
+
+    async def delete(self, guild_id: int, member_id: int):
+        self._pending[(guild_id, member_id)] = None
+        await self._maybe_flush()
+
+    async def delete_many(self, guild_id: int, member_ids):
+        for member_id in member_ids:
+            self._pending[(guild_id, member_id)] = None
+        await self._maybe_flush()
+
+    def _take_batch(self) -> tuple[dict, list[tuple], list[tuple]]:
+        batch, self._pending = self._pending, {}
+        upserts = [(g_id, m_id, *values) for (g_id, m_id), values in batch.items() if values is not None]
+        deletes = [key for key, values in batch.items() if values is None]
+        return batch, upserts, deletes
+
+    async def flush(self) -> bool:
+        """Returns False if the DB write failed (the writes stay buffered)."""
+        if not self._pending:
+            return True
+        # Swapping the dict and submitting to the DB thread happens without yielding, so any
+        # read that misses the new (empty) buffer is queued behind this flush on the DB thread.
+        batch, upserts, deletes = self._take_batch()
+        try:
+            await db.run(self.apply_writes, upserts, deletes)
+            log.info(f"Flushed {len(upserts)} {self.name} upserts and {len(deletes)} deletes to DB.")
+            return True
+        except sqlite3.Error as e:
+            log.error(f"DB error flushing {len(batch)} buffered {self.name} writes: {e}")
+            # Re-queue anything that has not been superseded by a newer write in the meantime.
+            for key, values in batch.items():
+                self._pending.setdefault(key, values)
+            return False
+
+    def flush_blocking(self) -> bool:
+        """Flushes from outside the event loop, used on shutdown after client.run() returns."""
+        if not self._pending:
+            return True
+        batch, upserts, deletes = self._take_batch()
+        try:
+            db.run_blocking(self.apply_writes, upserts, deletes)
+            log.info(f"Flushed {len(batch)} buffered {self.name} writes on shutdown.")
+            return True
+        except sqlite3.Error as e:
+            log.error(f"DB error flushing buffered {self.name} writes on shutdown: {e}")
+            return False
+
+    def start(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+class VerifiedMemberWriteBuffer(WriteBehindBuffer):
+    """Write-behind buffer for verified_members. Values are 1-tuples of the verified_at ISO string."""
+
+    def __init__(self, max_size: int, flush_seconds: float):
+        super().__init__('verified member', _apply_verified_member_writes, max_size, flush_seconds)
+
+    def lookup(self, guild_id: int, member_id: int) -> bool | None:
+        """True/False if a write is pending for this member, None if the DB is authoritative."""
+        key = (guild_id, member_id)
+        if key not in self._pending:
+            return None
+        return self._pending[key] is not None
+
+    async def upsert(self, guild_id: int, member_id: int):
+        self._pending[(guild_id, member_id)] = (datetime.now(timezone.utc).isoformat(),)
+        await self._maybe_flush()
+
+    async def upsert_many(self, guild_id: int, member_ids):
+        values = (datetime.now(timezone.utc).isoformat(),)
+        for member_id in member_ids:
+            self._pending[(guild_id, member_id)] = values
+        await self._maybe_flush()
+
+class MemberSnapshotBuffer(WriteBehindBuffer):
+    """Write-behind buffer for member_snapshot. Values are (joined_at, verified); a joined_at of
+    None keeps whatever joined_at is already recorded, both here and in the DB upsert."""
+
+    def __init__(self, max_size: int, flush_seconds: float):
+        super().__init__('member snapshot', _apply_member_snapshot_writes, max_size, flush_seconds)
+
+    def _put(self, key: tuple, joined_at: float | None, verified: bool):
+        if joined_at is None:
+            previous = self._pending.get(key)
+            if previous is not None:
+                joined_at = previous[0]
+        self._pending[key] = (joined_at, int(verified))
+
+    def lookup(self, guild_id: int, member_id: int) -> tuple | None:
+        """The pending (joined_at, verified) row of this member, None if the DB is authoritative."""
+        return self._pending.get((guild_id, member_id))
+
+    async def upsert(self, guild_id: int, member_id: int, joined_at: float | None, verified: bool):
+        self._put((guild_id, member_id), joined_at, verified)
+        await self._maybe_flush()
+
+    async def upsert_many(self, guild_id: int, rows):
+        """rows: iterable of (member_id, joined_at, verified)."""
+        for member_id, joined_at, verified in rows:
+            self._put((guild_id, member_id), joined_at, verified)
+        await self._maybe_flush()
+
+write_buffer = VerifiedMemberWriteBuffer(WRITE_BUFFER_MAX_SIZE, WRITE_BUFFER_FLUSH_SECONDS)
+snapshot_buffer = MemberSnapshotBuffer(WRITE_BUFFER_MAX_SIZE, WRITE_BUFFER_FLUSH_SECONDS)
+
+def _set_sorted(ids: array, member_id: int, present: bool):
+    i = bisect.bisect_left(ids, member_id)
+    found = i < len(ids) and ids[i] == member_id
+    if present and not found:
+        ids.insert(i, member_id)
+    elif found and not present:
+        del ids[i]
+
+class VerifiedMemberIndex:
+    """Verified member IDs of each guild as a sorted array('Q') of snowflakes, 8 bytes per member
+    with bisect lookups, so leaves can be checked without a DB round trip or a cached Member.
+    A guild's array is built by catch-up from the sorted member/snapshot merge and then kept in
+    step by the mark/remove helpers. Guilds that have not been caught up return None from
+    contains() and callers fall back to verified_members."""
+
+    def __init__(self):
+        self._guilds = {} # guild_id -> sorted array('Q') of verified member IDs
+        self._rebuilds = {} # guild_id -> [array being built, highest ID merged so far, {member_id: verified} for IDs past it]
+
+    def contains(self, guild_id: int, member_id: int) -> bool | None:
+        ids = self._guilds.get(guild_id)
+        if ids is None:
+            return None
+        i = bisect.bisect_left(ids, member_id)
+        return i < len(ids) and ids[i] == member_id
+
+    def update(self, guild_id: int, member_ids, verified: bool):
+        ids = self._guilds.get(guild_id)
+        rebuild = self._rebuilds.get(guild_id)
+        if ids is None and rebuild is None:
+            return
+        for member_id in member_ids:
+            if ids is not None:
+                _set_sorted(ids, member_id, verified)
+            if rebuild is not None:
+                # IDs the merge has not reached yet are replayed once it passes them.
+                if member_id <= rebuild[1]:
+                    _set_sorted(rebuild[0], member_id, verified)
+                else:
+                    rebuild[2][member_id] = verified
+
+    def begin_rebuild(self, guild_id: int):
+        self._rebuilds[guild_id] = [array('Q'), 0, {}]
+
+    def extend_rebuild(self, guild_id: int, verified_ids: list[int], merged_up_to: int):
+        """Appends the next page of verified IDs (ascending, all above the previous page) and
+        marks every ID up to merged_up_to as merged."""
+        rebuild = self._rebuilds[guild_id]
+        building, _, later = rebuild
+        building.extend(verified_ids)
+        rebuild[1] = max(rebuild[1], merged_up_to)
+        for member_id in [member_id for member_id in later if member_id <= rebuild[1]]:
+            _set_sorted(building, member_id, later.pop(member_id))
+
+    def finish_rebuild(self, guild_id: int):
+        building, _, later = self._rebuilds.pop(guild_id)
+        for member_id, verified in later.items():
+            _set_sorted(building, member_id, verified)
+        self._guilds[guild_id] = building
+
+    def cancel_rebuild(self, guild_id: int):
+        self._rebuilds.pop(guild_id, None)
+
+    def forget(self, guild_id: int):
+        self._guilds.pop(guild_id, None)
+        self._rebuilds.pop(guild_id, None)
+
+    def memory_bytes(self) -> int:
+        arrays = list(self._guilds.values()) + [rebuild[0] for rebuild in self._rebuilds.values()]
+        return sum(sys.getsizeof(ids) for ids in arrays)
+
+verified_index = VerifiedMemberIndex()
+
+def collect_verified_index_metrics():
+    VERIFIED_INDEX_MEMORY.set(verified_index.memory_bytes())
+
+metrics.add_collector(collect_verified_index_metrics)
+
+async def flush_write_buffers() -> bool:
+    verified_flushed = await write_buffer.flush()
+    snapshot_flushed = await snapshot_buffer.flush()
+    return verified_flushed and snapshot_flushed
+
+async def mark_member_verified_in_db(guild_id: int, member_id: int):
+    verified_index.update(guild_id, (member_id,), True)
+    await write_buffer.upsert(guild_id, member_id)
+    await snapshot_buffer.upsert(guild_id, member_id, None, True)
+    if DEBUG_LOGGING: log.debug(f"Marked member {member_id} in guild {guild_id} as verified in DB.")
+
+async def mark_members_verified_in_db(guild_id: int, member_ids: list[int]):
+    if member_ids:
+        verified_index.update(guild_id, member_ids, True)
+        await write_buffer.upsert_many(guild_id, member_ids)
+        await snapshot_buffer.upsert_many(guild_id, ((member_id, None, True) for member_id in member_ids))
+        log.info(f"Marked {len(member_ids)} members in guild {guild_id} as verified in DB.")
+
+async def remove_member_from_db(guild_id: int, member_id: int):
+    verified_index.update(guild_id, (member_id,), False)
+    await write_buffer.delete(guild_id, member_id)
+    await snapshot_buffer.delete(guild_id, member_id)
+
+async def remove_members_from_db(guild_id: int, member_ids: list[int]):
+    if member_ids:
+        verified_index.update(guild_id, member_ids, False)
+        await write_buffer.delete_many(guild_id, member_ids)
+        await snapshot_buffer.delete_many(guild_id, member_ids)
+
+@store_operation
+def _was_member_verified(conn: sqlite3.Connection, guild_id: int, member_id: int) -> bool:
+    cursor = conn.execute('''
+        SELECT 1 FROM verified_members
+        WHERE guild_id = ? AND member_id = ?
+    ''', (guild_id, member_id))
+    return cursor.fetchone() is not None
+
+async def was_member_verified_in_db(guild_id: int, member_id: int) -> bool:
+    verified = verified_index.contains(guild_id, member_id)
+    if verified is not None:
+        return verified
+    pending = write_buffer.lookup(guild_id, member_id)
+    if pending is not None:
+        return pending
     try:
-        cursor.execute('''
-            SELECT 1 FROM verified_members
-            WHERE guild_id = ? AND member_id = ?
-        ''', (guild_id, member_id))
-        return cursor.fetchone() is not None
+        return await db.run(_was_member_verified, guild_id, member_id)
     except sqlite3.Error as e:
-        print(f"{get_log_prefix()} DB_ERROR checking member {member_id} verification: {e}")
+        log.error(f"DB error checking member {member_id} verification: {e}")
         return False
-    finally:
-        conn.close()
 
-def get_all_verified_member_ids_from_db(guild_id: int) -> list[int]:
-    """Retrieves all member IDs marked as verified in the DB for a specific guild."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    member_ids = []
-    try:
-        cursor.execute('''
-            SELECT member_id FROM verified_members
-            WHERE guild_id = ?
-        ''', (guild_id,))
-        rows = cursor.fetchall()
-        member_ids = [row[0] for row in rows]
-    except sqlite3.Error as e:
-        print(f"{get_log_prefix()} DB_ERROR getting all verified members for guild {guild_id}: {e}")
-    finally:
-        conn.close()
-    return member_ids
+async def record_member_joined(member: discord.Member):
+    joined_at = member.joined_at.timestamp() if member.joined_at else None
+    await snapshot_buffer.upsert(member.guild.id, member.id, joined_at, False)
 
-def get_last_online_time() -> datetime | None:
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+@store_operation
+def _get_member_joined_at(conn: sqlite3.Connection, guild_id: int, member_id: int) -> float | None:
+    row = conn.execute('SELECT joined_at FROM member_snapshot WHERE guild_id = ? AND member_id = ?', (guild_id, member_id)).fetchone()
+    return row[0] if row else None
+
+async def get_member_joined_at(guild_id: int, member_id: int) -> datetime | None:
+    """When the member joined, from the snapshot (buffered writes first). None if it was never observed."""
+    pending = snapshot_buffer.lookup(guild_id, member_id)
+    joined_at = pending[0] if pending is not None else None
+    if joined_at is None:
+        try:
+            joined_at = await db.run(_get_member_joined_at, guild_id, member_id)
+        except sqlite3.Error as e:
+            log.error(f"DB error looking up when member {member_id} joined: {e}")
+    return datetime.fromtimestamp(joined_at, timezone.utc) if joined_at is not None else None
+
+@store_operation
+def _get_member_snapshot_page(conn: sqlite3.Connection, guild_id: int, after_member_id: int, limit: int) -> list[tuple]:
+    return conn.execute('''
+        SELECT member_id, verified FROM member_snapshot
+        WHERE guild_id = ? AND member_id > ?
+        ORDER BY member_id
+        LIMIT ?
+    ''', (guild_id, after_member_id, limit)).fetchall()
+
+async def iter_member_snapshot(guild_id: int, page_size: int):
+    """Yields (member_id, verified) snapshot rows of a guild in member_id order, reading one
+    keyset-paginated page at a time so memory stays bounded by page_size."""
+    after_member_id = 0
+    while True:
+        rows = await db.run(_get_member_snapshot_page, guild_id, after_member_id, page_size)
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            return
+        after_member_id = rows[-1][0]
+
+@store_operation
+def _get_last_online_time(conn: sqlite3.Connection) -> str | None:
+    row = conn.execute('SELECT last_online_time FROM bot_status WHERE id = 1').fetchone()
+    return row[0] if row else None
+
+async def get_last_online_time() -> datetime | None:
     last_online_time = None
     try:
-        cursor.execute('SELECT last_online_time FROM bot_status WHERE id = 1')
-        row = cursor.fetchone()
-        if row:
-            last_online_time = datetime.fromisoformat(row[0])
-            print(f"{get_log_prefix()} Retrieved last online time from DB: {last_online_time}")
+        last_online_time = await db.run(_get_last_online_time)
+        if last_online_time:
+            last_online_time = datetime.fromisoformat(last_online_time)
+            log.info(f"Retrieved last online time from DB: {last_online_time}")
     except sqlite3.Error as e:
-        print(f"{get_log_prefix()} DB_ERROR retrieving last online time: {e}")
-    finally:
-        conn.close()
+        log.error(f"DB error retrieving last online time: {e}")
     return last_online_time
 
-def update_last_online_time():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+@store_operation
+def _update_last_online_time(conn: sqlite3.Connection, current_time: str):
+    conn.execute('''
+        INSERT OR REPLACE INTO bot_status (id, last_online_time)
+        VALUES (1, ?)
+    ''', (current_time,))
+    conn.commit()
+
+async def update_last_online_time():
     current_time = datetime.now(timezone.utc).isoformat()
     try:
-        cursor.execute('''
+        await db.run(_update_last_online_time, current_time)
+        log.info(f"Updated last online time in DB to: {current_time}")
+    except sqlite3.Error as e:
+        log.error(f"DB error updating last online time: {e}")
+
+@store_operation
+def _apply_pending_verification_writes(conn: sqlite3.Connection, upserts: list[tuple], deletes: list[tuple]):
+    with conn:
+        if upserts:
+            conn.executemany('''
+                INSERT OR REPLACE INTO pending_verifications (guild_id, member_id, deadline, waiting_since)
+                VALUES (?, ?, ?, ?)
+            ''', upserts)
+        if deletes:
+            conn.executemany('''
+                DELETE FROM pending_verifications
+                WHERE guild_id = ? AND member_id = ?
+            ''', deletes)
+
+@store_operation
+def _get_pending_verifications(conn: sqlite3.Connection) -> list[tuple]:
+    return conn.execute('SELECT guild_id, member_id, deadline, waiting_since FROM pending_verifications').fetchall()
+
+@store_operation
+def _write_guild_checkpoints(conn: sqlite3.Connection, rows: list[tuple], current_time: str):
+    with conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO guild_checkpoints (guild_id, shard_id, last_seen)
+            VALUES (?, ?, ?)
+        ''', rows)
+        conn.execute('''
             INSERT OR REPLACE INTO bot_status (id, last_online_time)
             VALUES (1, ?)
         ''', (current_time,))
-        conn.commit()
-        print(f"{get_log_prefix()} Updated last online time in DB to: {current_time}")
+
+@store_operation
+def _get_guild_checkpoints(conn: sqlite3.Connection) -> list[tuple]:
+    return conn.execute('SELECT guild_id, last_seen FROM guild_checkpoints').fetchall()
+
+@store_operation
+def _delete_guild_checkpoint(conn: sqlite3.Connection, guild_id: int):
+    with conn:
+        conn.execute('DELETE FROM guild_checkpoints WHERE guild_id = ?', (guild_id,))
+
+async def get_guild_checkpoints() -> dict[int, datetime]:
+    try:
+        rows = await db.run(_get_guild_checkpoints)
     except sqlite3.Error as e:
-        print(f"{get_log_prefix()} DB_ERROR updating last online time: {e}")
-    finally:
-        conn.close()
+        log.error(f"DB error retrieving guild checkpoints: {e}")
+        return {}
+    return {guild_id: datetime.fromisoformat(last_seen) for guild_id, last_seen in rows}
+
+@store_operation
+def _get_guild_settings(conn: sqlite3.Connection) -> list[tuple]:
+    return conn.execute('SELECT guild_id, settings FROM guild_config').fetchall()
+
+@store_operation
+def _replace_guild_settings(conn: sqlite3.Connection, rows: list[tuple], current_time: str):
+    with conn:
+        conn.execute('DELETE FROM guild_config')
+        conn.executemany('''
+            INSERT INTO guild_config (guild_id, settings, updated_at)
+            VALUES (?, ?, ?)
+        ''', [(guild_id, settings, current_time) for guild_id, settings in rows])
+
+class CheckpointHeartbeat:
+    """Periodically records, per guild (and shard), the last time the bot was known to be
+    processing its events. A guild is live once its catch-up has finished and stops being
+    live while its shard is disconnected, so its checkpoint only ever covers time that was
+    actually processed. All live guilds are written in one transaction per interval."""
+
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._live = {} # guild_id -> shard_id
+        self._task = None
+
+    def mark_live(self, guild: discord.Guild):
+        self._live[guild.id] = guild.shard_id
+
+    def pause(self, shard_id: int | None = None):
+        """Stops advancing checkpoints for one shard's guilds, or for all guilds when shard_id is None."""
+        if shard_id is None:
+            self._live.clear()
+        else:
+            self._live = {guild_id: s_id for guild_id, s_id in self._live.items() if s_id != shard_id}
+
+    def resume(self, guilds):
+        for guild in guilds:
+            self.mark_live(guild)
+
+    async def forget(self, guild_id: int):
+        self._live.pop(guild_id, None)
+        try:
+            await db.run(_delete_guild_checkpoint, guild_id)
+        except sqlite3.Error as e:
+            log.error(f"DB error deleting checkpoint for guild {guild_id}: {e}")
+
+    def _rows(self) -> tuple[list[tuple], str]:
+        current_time = datetime.now(timezone.utc).isoformat()
+        return [(guild_id, shard_id, current_time) for guild_id, shard_id in self._live.items()], current_time
+
+    async def checkpoint(self):
+        """Saves "processed up to now" for the live guilds. The time is taken first and everything
+        buffered up to it (verified members, snapshot rows, verification deadlines) is flushed
+        before it is written, so a crash never leaves a checkpoint ahead of the persisted state.
+        If a flush fails the previous checkpoint stays in place."""
+        if not self._live:
+            return
+        rows, current_time = self._rows()
+        buffers_flushed = await flush_write_buffers()
+        deadlines_persisted = await verification_scheduler.persist()
+        if not (buffers_flushed and deadlines_persisted):
+            log.warning("Skipped guild checkpoints, buffered state could not be flushed.")
+            return
+        try:
+            await db.run(_write_guild_checkpoints, rows, current_time)
+        except sqlite3.Error as e:
+            log.error(f"DB error writing guild checkpoints: {e}")
+
+    def checkpoint_blocking(self):
+        if not self._live:
+            return
+        rows, current_time = self._rows()
+        try:
+            db.run_blocking(_write_guild_checkpoints, rows, current_time)
+            log.info(f"Saved checkpoints for {len(rows)} guilds on shutdown.")
+        except sqlite3.Error as e:
+            log.error(f"DB error writing guild checkpoints on shutdown: {e}")
+
+    @property
+    def started(self) -> bool:
+        """True once the startup catch-up has finished and the heartbeat is running."""
+        return self._task is not None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await self.checkpoint()
+
+checkpoint_heartbeat = CheckpointHeartbeat(CHECKPOINT_INTERVAL_SECONDS)
 
 # --- Bot Setup ---
 intents = discord.Intents.default()
 intents.members = True
 intents.guilds = True
-client = discord.Client(intents=intents)
-pending_verification_tasks = {}
 
-# --- Helper Functions ---
-def get_log_prefix():
-    return f"[{datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')}]"
+def member_cache_options() -> dict:
+    """Member cache settings for MEMBER_CACHE. 'lean' skips chunking at startup and only caches
+    members who join (or are updated) while the bot is online; catch-up streams members over REST
+    instead, pending newcomers are fetched into the cache on demand, and verified state lives in
+    verified_index as integers rather than Member objects."""
+    if MEMBER_CACHE == 'lean':
+        return {'member_cache_flags': discord.MemberCacheFlags(voice=False, joined=True), 'chunk_guilds_at_startup': False}
+    return {'member_cache_flags': discord.MemberCacheFlags.from_intents(intents), 'chunk_guilds_at_startup': True}
 
-async def kick_member(member: discord.Member, reason: str):
-    guild_id = member.guild.id
-    member_id = member.id
+def create_client() -> discord.Client:
+    """A plain Client by default; an AutoShardedClient when SHARD_COUNT is set, limited to
+    SHARD_IDS when this process only runs part of the shards."""
+    if not SHARD_COUNT:
+        return discord.Client(intents=intents, **member_cache_options())
+    options = member_cache_options()
+    if SHARD_COUNT.isdigit():
+        options['shard_count'] = int(SHARD_COUNT)
+        if SHARD_IDS:
+            options['shard_ids'] = SHARD_IDS
+    return discord.AutoShardedClient(intents=intents, **options)
+
+def owns_guild(guild_id: int) -> bool:
+    """Whether this process runs the shard that receives the guild's events. State in a shared
+    store belongs to every shard, so per-process work is filtered with this."""
+    if not SHARD_IDS:
+        return True
+    return (guild_id >> 22) % int(SHARD_COUNT) in SHARD_IDS
+
+client = create_client()
+
+# --- Helper Functions ---
+async def kick_member(member: discord.Member, reason: str) -> bool:
+    """Kicks a member and returns whether it succeeded. Rate limits are re-raised for the caller to back off."""
     try:
         await member.kick(reason=reason)
-        print(f"{get_log_prefix()} Kicked member {member.name}#{member.discriminator} (ID: {member_id}). Reason: {reason}")
-        remove_member_from_db(guild_id, member_id)
+        if raid_monitor.active(member.guild.id):
+            if DEBUG_LOGGING: log.debug(f"Kicked member {member.name}#{member.discriminator} (ID: {member.id}). Reason: {reason}")
+            return True
+        log.info(f"Kicked member {member.name}#{member.discriminator} (ID: {member.id}). Reason: {reason}")
+        return True
     except discord.Forbidden:
-        print(f"{get_log_prefix()} ERROR: Bot lacks permission to kick {member.name}#{member.discriminator} (ID: {member_id}).")
+        log.error(f"Bot lacks permission to kick {member.name}#{member.discriminator} (ID: {member.id}).")
+    except discord.NotFound:
+        if DEBUG_LOGGING: log.debug(f"Member {member.name} (ID: {member.id}) already left before kick.")
     except discord.HTTPException as e:
-        print(f"{get_log_prefix()} ERROR: Failed to kick {member.name}#{member.discriminator} (ID: {member_id}): {e}")
+        if e.status == 429:
+            raise
+        log.error(f"Failed to kick {member.name}#{member.discriminator} (ID: {member.id}): {e}")
+    return False
 
-# --- Core Logic Task ---
-async def kick_if_not_verified(member: discord.Member, initial_delay_seconds: float = None):
-    actual_delay = VERIFICATION_TIMEOUT_SECONDS if initial_delay_seconds is None else initial_delay_seconds
+class GuildKickPipeline:
+    """Queue of pending kicks for one guild, drained by up to `concurrency` workers. Workers
+    only exist while there is work, a 429 pauses the whole guild for retry_after, and the
+    verified_members removals for kicked members are written as one group per drain.
+    Kicks submitted with recheck_verified are dropped if the member has the verified role
+    by the time a worker reaches them."""
 
-    if actual_delay <= 0:
-        print(f"{get_log_prefix()} Immediate verification check for {member.name}#{member.discriminator} (ID: {member.id}).")
-    else:
-        print(f"{get_log_prefix()} Scheduled verification task for {member.name}#{member.discriminator} (ID: {member.id}). Timeout: {actual_delay:.1f}s.")
-        await asyncio.sleep(actual_delay)
+    def __init__(self, guild_id: int, concurrency: int):
+        self.guild_id = guild_id
+        self.concurrency = max(1, concurrency)
+        self._queue = collections.deque() # (member, reason, recheck_verified)
+        self._queued_ids = set()
+        self._workers = set()
+        self._removed_ids = []
+        self._paused_until = 0.0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._started_at = None
+        self.kicked = 0
+        self.failed = 0
+        self.rate_limited = 0
 
-    if member.id not in pending_verification_tasks or pending_verification_tasks[member.id].done():
-        if member.id not in pending_verification_tasks:
-             print(f"{get_log_prefix()} Verification task for {member.name}#{member.discriminator} (ID: {member.id}) already handled or cancelled.")
-        return
+    def submit(self, member: discord.Member, reason: str, recheck_verified: bool = False) -> bool:
+        if member.id in self._queued_ids:
+            return False
+        self._queued_ids.add(member.id)
+        self._queue.append((member, reason, recheck_verified))
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        self._idle.clear()
+        while len(self._workers) < min(self.concurrency, len(self._queue)):
+            worker = asyncio.create_task(self._work())
+            self._workers.add(worker)
+        return True
 
-    try:
-        guild = member.guild
-        if not guild:
-            print(f"{get_log_prefix()} ERROR: Could not get guild for member {member.name} (ID: {member.id}) during kick check.")
-            if member.id in pending_verification_tasks: del pending_verification_tasks[member.id]
+    def cancel(self, member_id: int) -> bool:
+        """Drops a queued recheck_verified kick, once the member is known to be verified. Returns
+        False if none is queued (a kick already in flight is not stopped)."""
+        if member_id not in self._queued_ids or not any(entry[0].id == member_id and entry[2] for entry in self._queue):
+            return False
+        self._queue = collections.deque(entry for entry in self._queue if entry[0].id != member_id)
+        self._queued_ids.discard(member_id)
+        return True
+
+    async def join(self):
+        await self._idle.wait()
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {'queue_depth': len(self._queue), 'in_flight': len(self._queued_ids) - len(self._queue),
+                'kicked': self.kicked, 'failed': self.failed, 'rate_limited': self.rate_limited,
+                'kicks_per_second': self.kicked / elapsed if elapsed > 0 else 0.0}
+
+    async def _work(self):
+        try:
+            while self._queue:
+                delay = self._paused_until - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                member, reason, recheck_verified = self._queue.popleft()
+                if recheck_verified and self._is_verified_now(member):
+                    self._queued_ids.discard(member.id)
+                    if DEBUG_LOGGING: log.debug(f"Dropped queued kick for {member.name} (ID: {member.id}), verified since it was queued.")
+                    continue
+                try:
+                    if await kick_member(member, reason):
+                        self.kicked += 1
+                        KICKS.labels('success').inc()
+                        self._removed_ids.append(member.id)
+                    else:
+                        self.failed += 1
+                        KICKS.labels('failure').inc()
+                    self._queued_ids.discard(member.id)
+                except (discord.RateLimited, discord.HTTPException) as e:
+                    retry_after = getattr(e, 'retry_after', None) or 1.0
+                    self.rate_limited += 1
+                    KICKS.labels('rate_limited').inc()
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                    self._queue.appendleft((member, reason, recheck_verified))
+                    log.info(f"Rate limited while kicking in guild {self.guild_id}, pausing kicks for {retry_after:.2f}s.")
+                except Exception as e:
+                    self.failed += 1
+                    KICKS.labels('failure').inc()
+                    self._queued_ids.discard(member.id)
+                    log.error(f"Unexpected error kicking {member.name} (ID: {member.id}): {e}")
+            if self._removed_ids:
+                removed_ids, self._removed_ids = self._removed_ids, []
+                await remove_members_from_db(self.guild_id, removed_ids)
+        finally:
+            self._workers.discard(asyncio.current_task())
+            if not self._workers and not self._queue:
+                self._idle.set()
+
+    @staticmethod
+    def _is_verified_now(member: discord.Member) -> bool:
+        """Checks the cached member, whose roles follow gateway updates, rather than the queued copy."""
+        current = member.guild.get_member(member.id) or member
+        return guild_configs.get(member.guild).is_verified(current)
+
+class KickExecutor:
+    """Per-guild kick pipelines with bounded concurrency."""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.pipelines = {} # guild_id -> GuildKickPipeline
+
+    def submit(self, member: discord.Member, reason: str, recheck_verified: bool = False) -> bool:
+        pipeline = self.pipelines.get(member.guild.id)
+        if pipeline is None:
+            pipeline = self.pipelines[member.guild.id] = GuildKickPipeline(member.guild.id, self.concurrency)
+        return pipeline.submit(member, reason, recheck_verified)
+
+    def cancel(self, guild_id: int, member_id: int) -> bool:
+        pipeline = self.pipelines.get(guild_id)
+        return pipeline is not None and pipeline.cancel(member_id)
+
+    async def join(self, guild_id: int | None = None):
+        pipelines = self.pipelines.values() if guild_id is None else [self.pipelines[guild_id]] if guild_id in self.pipelines else []
+        await asyncio.gather(*(pipeline.join() for pipeline in pipelines))
+
+    def stats(self) -> dict:
+        per_guild = {guild_id: pipeline.stats() for guild_id, pipeline in self.pipelines.items()}
+        totals = {key: sum(stats[key] for stats in per_guild.values()) for key in ('queue_depth', 'in_flight', 'kicked', 'failed', 'rate_limited')}
+        return {'guilds': per_guild, **totals}
+
+kick_executor = KickExecutor(KICK_CONCURRENCY)
+
+# --- Account Age Screening ---
+DISCORD_EPOCH_MS = 1420070400000
+
+def snowflake_cutoff(moment: datetime) -> int:
+    """Largest snowflake that can have been created at or before `moment`."""
+    return ((int(moment.timestamp() * 1000) - DISCORD_EPOCH_MS) << 22) | 0x3FFFFF
+
+class AccountAgeScreen:
+    """An account is too new when its snowflake ID is greater than the snowflake of
+    (now - MIN_ACCOUNT_AGE_DAYS). The cutoff is recomputed at most once per second, so
+    each screening is a single integer compare on member.id."""
+
+    def __init__(self, min_age_days: int):
+        self.min_age_days = min_age_days
+        self._tick = None
+        self._cutoff = 0
+
+    def cutoff(self) -> int:
+        tick = int(time.time())
+        if tick != self._tick:
+            self._tick = tick
+            self._cutoff = snowflake_cutoff(datetime.now(timezone.utc) - timedelta(days=self.min_age_days))
+        return self._cutoff
+
+    def is_too_new(self, member_id: int) -> bool:
+        return member_id > self.cutoff()
+
+def screen_member_ids(member_ids, cutoff: int, pending=frozenset()) -> tuple[set[int], set[int], set[int]]:
+    """Splits a page of unverified candidate IDs into (kick, schedule, skip) sets: too new,
+    needing a verification check, and already having a pending check."""
+    ids = set(member_ids)
+    kick = {member_id for member_id in ids if member_id > cutoff}
+    remaining = ids - kick
+    skip = remaining.intersection(pending)
+    return kick, remaining - skip, skip
+
+def account_age_days(member_id: int) -> int:
+    # Only needed for the kick reason text, not for the screening decision itself.
+    return (datetime.now(timezone.utc) - discord.utils.snowflake_time(member_id)).days
+
+age_screens = {} # min_age_days -> AccountAgeScreen, shared by every guild using that minimum
+
+def age_screen_for(min_age_days: int) -> AccountAgeScreen:
+    screen = age_screens.get(min_age_days)
+    if screen is None:
+        screen = age_screens[min_age_days] = AccountAgeScreen(min_age_days)
+    return screen
+
+# --- Raid Mode ---
+class RaidState:
+    __slots__ = ('guild', 'started', 'last_hot', 'joins', 'kicks', 'deferred_welcomes')
+
+    def __init__(self, guild: discord.Guild, now: float):
+        self.guild = guild
+        self.started = now
+        self.last_hot = now # Last time the join rate was at or above the threshold
+        self.joins = 0
+        self.kicks = 0
+        self.deferred_welcomes = [] # (member_id, channel, mention, single_message, batch_template)
+
+class RaidMonitor:
+    """Per-guild sliding-window join-rate detector. Each guild keeps only the times of its last
+    `threshold` joins, so the rate check is one subtraction: the window is exceeded when the
+    oldest of them is less than window_seconds old. While a guild is in raid mode the join
+    handler screens with RAID_MIN_ACCOUNT_AGE_DAYS, per-member logging is suppressed and welcomes
+    are held back and sent as one batch when the raid ends. Transitions are dispatched as the
+    custom client events raid_mode_start(guild) and raid_mode_end(guild, joins, kicks)."""
+
+    def __init__(self, threshold: int, window_seconds: float, cooldown_seconds: float):
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self._joins = {} # guild_id -> deque of monotonic join times, at most `threshold` long
+        self._raids = {} # guild_id -> RaidState
+
+    def active(self, guild_id: int) -> bool:
+        return guild_id in self._raids
+
+    def record_join(self, guild: discord.Guild) -> bool:
+        """Records a join and returns whether the guild is (now) in raid mode."""
+        if self.threshold <= 0:
+            return False
+        now = time.monotonic()
+        joins = self._joins.get(guild.id)
+        if joins is None:
+            joins = self._joins[guild.id] = collections.deque(maxlen=self.threshold)
+        joins.append(now)
+        raid = self._raids.get(guild.id)
+        if len(joins) == self.threshold and now - joins[0] <= self.window_seconds:
+            if raid is None:
+                raid = self._start(guild, now)
+            raid.last_hot = now
+        if raid is not None:
+            raid.joins += 1
+        return raid is not None
+
+    def record_kick(self, guild_id: int):
+        raid = self._raids.get(guild_id)
+        if raid is not None:
+            raid.kicks += 1
+
+    def defer_welcome(self, guild_id: int, member_id: int, channel: discord.TextChannel, mention: str,
+                      single_message: str, batch_template) -> bool:
+        """Holds a welcome until the guild's raid ends. Returns False if the guild is not in raid mode."""
+        raid = self._raids.get(guild_id)
+        if raid is None:
+            return False
+        raid.deferred_welcomes.append((member_id, channel, mention, single_message, batch_template))
+        return True
+
+    def _start(self, guild: discord.Guild, now: float) -> RaidState:
+        raid = self._raids[guild.id] = RaidState(guild, now)
+        RAID_MODE.labels(guild.id).set(1)
+        RAID_TRANSITIONS.labels('start').inc()
+        log.warning(f"Raid mode enabled for guild {guild.name} (ID: {guild.id}): {self.threshold}+ joins within {self.window_seconds:g}s. "
+                    f"Screening accounts younger than {raid_age_screen(guild).min_age_days} days.")
+        client.dispatch('raid_mode_start', guild)
+        asyncio.get_running_loop().call_later(self.cooldown_seconds, self._maybe_end, guild.id)
+        return raid
+
+    def _maybe_end(self, guild_id: int):
+        raid = self._raids.get(guild_id)
+        if raid is None:
+            return
+        remaining = raid.last_hot + self.cooldown_seconds - time.monotonic()
+        if remaining > 0:
+            asyncio.get_running_loop().call_later(remaining, self._maybe_end, guild_id)
             return
+        del self._raids[guild_id]
+        self._joins.pop(guild_id, None)
+        RAID_MODE.labels(guild_id).set(0)
+        RAID_TRANSITIONS.labels('end').inc()
+        guild = raid.guild
+        log.warning(f"Raid mode ended for guild {guild.name} (ID: {guild_id}) after {time.monotonic() - raid.started:.0f}s: "
+                    f"{raid.joins} joins, {raid.kicks} kicked, {len(raid.deferred_welcomes)} deferred welcomes.")
+        # Queued without awaiting in between, so the dispatcher renders them as one batch.
+        for member_id, channel, mention, single_message, batch_template in raid.deferred_welcomes:
+            if guild.get_member(member_id) is not None:
+                message_dispatcher.welcome(channel, mention, single_message, batch_template)
+        client.dispatch('raid_mode_end', guild, raid.joins, raid.kicks)
+
+raid_monitor = RaidMonitor(RAID_JOIN_THRESHOLD, RAID_WINDOW_SECONDS, RAID_COOLDOWN_SECONDS)
+
+def raid_age_screen(guild: discord.Guild) -> AccountAgeScreen:
+    # Never looser than the guild's normal minimum.
+    return age_screen_for(max(RAID_MIN_ACCOUNT_AGE_DAYS, guild_configs.get(guild).min_account_age_days))
+
+# --- Guild Config ---
+GUILD_SETTINGS = { # Settings a guild can override in guild_config; the env values above are the defaults
+    'WELCOME_CHANNEL_ID': int,
+    'VERIFIED_ROLE_NAME': str,
+    'MENTION_CHANNEL_NAME': str,
+    'VERIFICATION_TIMEOUT_SECONDS': int,
+    'MIN_ACCOUNT_AGE_DAYS': int,
+    'QUICK_LEAVE_TIMEOUT_SECONDS': int,
+    'WELCOME_MESSAGE': str,
+    'BATCH_WELCOME_MESSAGE': str,
+    'GOODBYE_MESSAGE': str,
+    'QUICK_LEAVE_GOODBYE_MESSAGE': str,
+    'BATCH_GOODBYE_MESSAGE': str,
+    'LIVE_BATCH_WELCOME_MESSAGE': str,
+    'LIVE_BATCH_GOODBYE_MESSAGE': str,
+}
+
+def validate_guild_settings(guild_id, settings: dict) -> dict:
+    """Keeps the known settings of one guild, converted to their types. Anything else is logged and dropped."""
+    valid = {}
+    for name, value in settings.items():
+        kind = GUILD_SETTINGS.get(name)
+        if kind is None:
+            log.warning(f"Ignoring unknown setting '{name}' for guild {guild_id}.")
+            continue
+        try:
+            valid[name] = value if value is None and kind is str else kind(value)
+        except (TypeError, ValueError):
+            log.warning(f"Ignoring invalid value {value!r} for setting '{name}' of guild {guild_id}.")
+    return valid
 
-        current_member_info = await guild.fetch_member(member.id)
-        if not current_member_info:
-            print(f"{get_log_prefix()} Member {member.name} (ID: {member.id}) left before verification timeout completion.")
-            remove_member_from_db(guild.id, member.id)
-            if member.id in pending_verification_tasks: del pending_verification_tasks[member.id]
+def _format_field(value, conversion: str | None, spec: str) -> str:
+    if conversion == 'r':
+        value = repr(value)
+    elif conversion == 'a':
+        value = ascii(value)
+    elif conversion == 's':
+        value = str(value)
+    return format(value, spec)
+
+class CompiledTemplate:
+    """A message template parsed once per guild, with the per-guild fields (guild_name,
+    specific_channel_mention) already filled in. render() only joins the literal chunks with
+    the per-member values instead of running str.format on every message."""
+    __slots__ = ('source', '_literals', '_fields')
+
+    def __init__(self, source: str, member_fields: tuple, **constants):
+        self.source = source
+        self._literals = [''] # One more literal than fields: literal, field, literal, ...
+        self._fields = [] # (name, conversion, spec)
+        for literal, name, spec, conversion in string.Formatter().parse(source):
+            self._literals[-1] += literal
+            if name is None:
+                continue
+            if spec and '{' in spec:
+                raise ValueError(f"nested replacement field in '{{{name}:{spec}}}'")
+            if name in constants:
+                self._literals[-1] += _format_field(constants[name], conversion, spec or '')
+            elif name in member_fields:
+                self._fields.append((name, conversion, spec or ''))
+                self._literals.append('')
+            else:
+                raise KeyError(name)
+
+    def render(self, **values) -> str:
+        parts = [self._literals[0]]
+        for (name, conversion, spec), literal in zip(self._fields, self._literals[1:]):
+            parts.append(_format_field(values[name], conversion, spec))
+            parts.append(literal)
+        return ''.join(parts)
+
+class GuildConfig:
+    """Per-guild settings (env defaults plus guild_config overrides) with roles, channels and
+    templates resolved once, instead of on every event."""
+    __slots__ = ('verified_role_name', 'verified_role_id', 'welcome_channel_id', 'welcome_channel', 'specific_channel_mention',
+                 'verification_timeout_seconds', 'min_account_age_days', 'age_screen', 'quick_leave_timeout_seconds',
+                 'welcome_template', 'batch_welcome_template', 'live_batch_welcome_template', 'goodbye_template',
+                 'quick_leave_goodbye_template', 'batch_goodbye_template', 'live_batch_goodbye_template')
+
+    def __init__(self, guild: discord.Guild, overrides: dict):
+        def setting(name: str):
+            return overrides.get(name, globals()[name])
+
+        self.verified_role_name = setting('VERIFIED_ROLE_NAME')
+        verified_role = discord.utils.get(guild.roles, name=self.verified_role_name)
+        self.verified_role_id = verified_role.id if verified_role else None
+        self.welcome_channel_id = setting('WELCOME_CHANNEL_ID')
+        channel = guild.get_channel(self.welcome_channel_id) if self.welcome_channel_id != 0 else None
+        self.welcome_channel = channel if isinstance(channel, discord.TextChannel) else None
+        self.specific_channel_mention = ""
+        mention_channel_name = setting('MENTION_CHANNEL_NAME')
+        if mention_channel_name:
+            tmc_obj = discord.utils.get(guild.text_channels, name=mention_channel_name)
+            self.specific_channel_mention = tmc_obj.mention if tmc_obj else f"#{mention_channel_name}"
+        self.verification_timeout_seconds = setting('VERIFICATION_TIMEOUT_SECONDS')
+        self.min_account_age_days = setting('MIN_ACCOUNT_AGE_DAYS')
+        self.age_screen = age_screen_for(self.min_account_age_days)
+        self.quick_leave_timeout_seconds = setting('QUICK_LEAVE_TIMEOUT_SECONDS')
+
+        constants = {'guild_name': guild.name, 'specific_channel_mention': self.specific_channel_mention}
+        def compile_template(name: str, member_fields: tuple) -> CompiledTemplate | None:
+            # An empty (or null) template disables the message, whether it is the override or the default.
+            sources = (overrides[name], globals()[name]) if name in overrides else (globals()[name],)
+            for source in sources:
+                if not source:
+                    return None
+                try:
+                    return CompiledTemplate(source, member_fields, **constants)
+                except (KeyError, ValueError) as e:
+                    log.error(f"Invalid {name} for guild {guild.name} (ID: {guild.id}): {e!r}. Falling back to the default.")
+            return None
+        self.welcome_template = compile_template('WELCOME_MESSAGE', ('member_mention',))
+        self.batch_welcome_template = compile_template('BATCH_WELCOME_MESSAGE', ('member_mentions_list',))
+        self.goodbye_template = compile_template('GOODBYE_MESSAGE', ('member_name',))
+        self.quick_leave_goodbye_template = compile_template('QUICK_LEAVE_GOODBYE_MESSAGE', ('member_name',))
+        self.batch_goodbye_template = compile_template('BATCH_GOODBYE_MESSAGE', ('member_names_list',))
+        # Batches of events that happened while the bot was online, not during catch-up.
+        self.live_batch_welcome_template = compile_template('LIVE_BATCH_WELCOME_MESSAGE', ('member_mentions_list',))
+        self.live_batch_goodbye_template = compile_template('LIVE_BATCH_GOODBYE_MESSAGE', ('member_names_list',))
+
+    def is_verified(self, member: discord.Member) -> bool:
+        # get_role is an ID lookup on the member's sorted role-ID array, not a scan of Role objects.
+        return self.verified_role_id is not None and member.get_role(self.verified_role_id) is not None
+
+class GuildConfigCache:
+    """GuildConfig per guild, dropped by the on_guild_update / on_guild_role_* / on_guild_channel_*
+    events and cleared whenever the guild settings are reloaded."""
+
+    def __init__(self):
+        self._configs = {} # guild_id -> GuildConfig
+
+    def get(self, guild: discord.Guild) -> GuildConfig:
+        config = self._configs.get(guild.id)
+        if config is None:
+            config = self._configs[guild.id] = GuildConfig(guild, guild_settings.get(guild.id))
+        return config
+
+    def invalidate(self, guild_id: int):
+        self._configs.pop(guild_id, None)
+
+    def clear(self):
+        self._configs.clear()
+
+guild_configs = GuildConfigCache()
+
+def _read_json_file(path: str) -> tuple[float, dict]:
+    mtime = os.stat(path).st_mtime
+    with open(path) as f:
+        return mtime, json.load(f)
+
+class GuildSettingsStore:
+    """In-memory copy of the guild_config table. reload() re-reads the table, after importing
+    GUILD_CONFIG_PATH into it when that file has changed, and clears the GuildConfig cache so
+    the new settings apply without a restart. Reloads are triggered by SIGHUP and by polling
+    the file's modification time. A file that cannot be read is skipped until it changes
+    again, and the watcher keeps the settings already loaded in place."""
+
+    def __init__(self, path: str | None, poll_seconds: float):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self._overrides = {} # guild_id -> {setting name: value}
+        self._mtime = None
+        self._loaded = False
+        self._watcher = None
+        self._reload_tasks = set() # Started by SIGHUP, referenced until done
+
+    def get(self, guild_id: int) -> dict:
+        return self._overrides.get(guild_id, {})
+
+    async def _import_file(self, force: bool) -> bool:
+        """Returns False if the file could not be read or parsed."""
+        mtime = None
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if not force and mtime == self._mtime:
+                return True
+            mtime, data = await asyncio.get_running_loop().run_in_executor(None, _read_json_file, self.path)
+            rows = [(int(guild_id), json.dumps(validate_guild_settings(guild_id, settings))) for guild_id, settings in data.items()]
+        except (OSError, ValueError, AttributeError) as e:
+            log.error(f"Could not read guild config file '{self.path}': {e}")
+            if mtime is not None:
+                self._mtime = mtime # Not retried by the watcher until the file changes again
+            return False
+        await db.run(_replace_guild_settings, rows, datetime.now(timezone.utc).isoformat())
+        self._mtime = mtime
+        log.info(f"Imported settings for {len(rows)} guilds from '{self.path}'.")
+        return True
+
+    async def reload(self, force: bool = False):
+        try:
+            if self.path and not await self._import_file(force) and self._loaded and not force:
+                return # Nothing new to load, keep the current overrides and cached configs
+            rows = await db.run(_get_guild_settings)
+        except sqlite3.Error as e:
+            log.error(f"DB error reloading guild settings: {e}")
             return
+        overrides = {}
+        for guild_id, settings in rows:
+            try:
+                overrides[guild_id] = validate_guild_settings(guild_id, json.loads(settings))
+            except (ValueError, AttributeError) as e:
+                log.error(f"Invalid guild_config row for guild {guild_id}: {e}")
+        self._overrides = overrides
+        self._loaded = True
+        guild_configs.clear()
+        log.info(f"Loaded setting overrides for {len(overrides)} guilds.")
+
+    def start(self):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self._reload_on_signal)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            pass # No SIGHUP (Windows); the file watcher still works
+        if self.path and (self._watcher is None or self._watcher.done()):
+            self._watcher = asyncio.create_task(self._run())
+
+    def _reload_on_signal(self):
+        task = asyncio.create_task(self.reload(force=True))
+        self._reload_tasks.add(task)
+        task.add_done_callback(self._reload_tasks.discard)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                changed = os.stat(self.path).st_mtime != self._mtime
+            except OSError:
+                changed = False
+            if changed:
+                await self.reload()
+
+guild_settings = GuildSettingsStore(GUILD_CONFIG_PATH, GUILD_CONFIG_POLL_SECONDS)
+
+# --- Message Dispatch ---
+DISCORD_MESSAGE_LIMIT = 2000
 
-        verified_role = discord.utils.get(current_member_info.roles, name=VERIFIED_ROLE_NAME)
-        if not verified_role:
-            timeout_reason = f"Not verified with the '{VERIFIED_ROLE_NAME}' role within the allocated time."
-            await kick_member(current_member_info, timeout_reason)
+def split_message(message: str) -> list[str]:
+    """Splits a message over Discord's character limit at the last line break, or else space, that fits."""
+    parts = []
+    while len(message) > DISCORD_MESSAGE_LIMIT:
+        cut = message.rfind('\n', 1, DISCORD_MESSAGE_LIMIT + 1)
+        if cut == -1:
+            cut = message.rfind(' ', 1, DISCORD_MESSAGE_LIMIT + 1)
+        if cut == -1:
+            parts.append(message[:DISCORD_MESSAGE_LIMIT])
+            message = message[DISCORD_MESSAGE_LIMIT:]
         else:
-            print(f"{get_log_prefix()} Member {current_member_info.name} (ID: {current_member_info.id}) was found verified by kick task.")
-            mark_member_verified_in_db(guild.id, current_member_info.id)
+            parts.append(message[:cut])
+            message = message[cut + 1:]
+    if message:
+        parts.append(message)
+    return parts
+
+def render_batches(template: CompiledTemplate, list_key: str, items: list[str]) -> list[str]:
+    """Renders template once per chunk of items, keeping every message within Discord's character
+    limit. An item too long to fit on its own is sent alone and split by the dispatcher."""
+    overhead = len(template.render(**{list_key: ''}))
+    messages, chunk, length = [], [], overhead
+    for item in items:
+        added = len(item) + (2 if chunk else 0)
+        if chunk and length + added > DISCORD_MESSAGE_LIMIT:
+            messages.append(template.render(**{list_key: ', '.join(chunk)}))
+            chunk, length = [], overhead
+            added = len(item)
+        chunk.append(item)
+        length += added
+    if chunk:
+        messages.append(template.render(**{list_key: ', '.join(chunk)}))
+    return messages
+
+class _ChannelQueue:
+    __slots__ = ('channel', 'guild_name', 'batch_welcome_template', 'batch_goodbye_template', 'welcomes', 'goodbyes', 'last_flush', 'flush_task')
+
+    def __init__(self, channel: discord.TextChannel):
+        self.channel = channel
+        self.guild_name = channel.guild.name
+        self.batch_welcome_template = None
+        self.batch_goodbye_template = None
+        self.welcomes = [] # (member mention, rendered single welcome)
+        self.goodbyes = [] # (member name, rendered single goodbye)
+        self.last_flush = 0.0
+        self.flush_task = None
+
+class MessageDispatcher:
+    """Coalesces welcomes and goodbyes per channel. The first message in a quiet channel goes out
+    on the next loop iteration; anything arriving within MESSAGE_BATCH_WINDOW_SECONDS of the last
+    send is held and rendered into the batch template passed with it: BATCH_WELCOME_MESSAGE /
+    BATCH_GOODBYE_MESSAGE for catch-up, LIVE_BATCH_WELCOME_MESSAGE / LIVE_BATCH_GOODBYE_MESSAGE
+    while online. Messages over Discord's character limit are split."""
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._queues = {} # channel_id -> _ChannelQueue
+
+    def _queue(self, channel: discord.TextChannel) -> _ChannelQueue:
+        queue = self._queues.get(channel.id)
+        if queue is None:
+            queue = self._queues[channel.id] = _ChannelQueue(channel)
+        queue.channel = channel
+        return queue
+
+    def welcome(self, channel: discord.TextChannel, mention: str, single_message: str, batch_template: CompiledTemplate | None):
+        queue = self._queue(channel)
+        queue.welcomes.append((mention, single_message))
+        queue.batch_welcome_template = batch_template
+        self._schedule(queue)
+
+    def goodbye(self, channel: discord.TextChannel, member_name: str, single_message: str, batch_template: CompiledTemplate | None):
+        queue = self._queue(channel)
+        queue.goodbyes.append((member_name, single_message))
+        queue.batch_goodbye_template = batch_template
+        self._schedule(queue)
+
+    def pending(self) -> int:
+        return sum(len(queue.welcomes) + len(queue.goodbyes) for queue in self._queues.values())
+
+    def _schedule(self, queue: _ChannelQueue):
+        if queue.flush_task is None or queue.flush_task.done():
+            delay = max(0.0, queue.last_flush + self.window_seconds - time.monotonic())
+            queue.flush_task = asyncio.create_task(self._flush_after(queue, delay))
+
+    async def _flush_after(self, queue: _ChannelQueue, delay: float):
+        if delay > 0:
+            await asyncio.sleep(delay)
+        welcomes, queue.welcomes = queue.welcomes, []
+        goodbyes, queue.goodbyes = queue.goodbyes, []
+        queue.last_flush = time.monotonic()
+
+        messages = []
+        if len(welcomes) == 1 or (welcomes and queue.batch_welcome_template is None):
+            messages.extend(single_message for _, single_message in welcomes)
+        elif welcomes:
+            messages.extend(render_batches(queue.batch_welcome_template, 'member_mentions_list', [mention for mention, _ in welcomes]))
+        if len(goodbyes) == 1 or (goodbyes and queue.batch_goodbye_template is None):
+            messages.extend(single_message for _, single_message in goodbyes)
+        elif goodbyes:
+            messages.extend(render_batches(queue.batch_goodbye_template, 'member_names_list', [name for name, _ in goodbyes]))
+
+        messages = [part for message in messages for part in split_message(message)]
+        for message in messages:
+            started = time.perf_counter()
+            try:
+                await queue.channel.send(message)
+                MESSAGE_SEND_SECONDS.observe(time.perf_counter() - started)
+            except Exception as e:
+                log.error(f"Error sending message to channel {queue.channel.id}: {e}")
+        if len(welcomes) > 1 or len(goodbyes) > 1:
+            log.info(f"Sent {len(welcomes)} welcomes and {len(goodbyes)} goodbyes in {len(messages)} messages to {queue.guild_name}.")
+        if queue.welcomes or queue.goodbyes:
+            # Queued while we were sending: _schedule() saw this task still running, so re-arm here.
+            delay = max(0.0, queue.last_flush + self.window_seconds - time.monotonic())
+            queue.flush_task = asyncio.create_task(self._flush_after(queue, delay))
+
+message_dispatcher = MessageDispatcher(MESSAGE_BATCH_WINDOW_SECONDS)
+
+# --- Core Logic Task ---
+VERIFICATION_BATCH_SIZE = 50 # Due checks processed per scheduler wake-up
+
+async def check_member_verification(guild_id: int, member_id: int, record: 'PendingVerification | None' = None):
+    """Runs once a member's verification deadline has passed: kicks them if they still lack the role.
+    Gives up without kicking if the scheduler's record is cancelled while the member is fetched."""
+    guild = client.get_guild(guild_id)
+    if not guild:
+        log.error(f"Could not get guild {guild_id} for member (ID: {member_id}) during kick check.")
+        return
+
+    try:
+        current_member_info = await guild.fetch_member(member_id)
+        if record is not None and record.state == PendingVerification.CANCELLED:
+            if DEBUG_LOGGING: log.debug(f"Verification check for member (ID: {member_id}) was cancelled during the fetch.")
+            return
+        config = guild_configs.get(guild)
+        if not config.is_verified(current_member_info):
+            timeout_reason = f"Not verified with the '{config.verified_role_name}' role within the allocated time."
+            if record is not None and record.state == PendingVerification.CANCELLED:
+                return
+            kick_executor.submit(current_member_info, timeout_reason, recheck_verified=True)
+        else:
+            if DEBUG_LOGGING: log.debug(f"Member {current_member_info.name} (ID: {current_member_info.id}) was found verified by kick task.")
+            await mark_member_verified_in_db(guild.id, current_member_info.id)
 
     except discord.NotFound:
-        print(f"{get_log_prefix()} Member {member.name} (ID: {member.id}) not found during kick check. Likely left.")
-        if member.guild: remove_member_from_db(member.guild.id, member.id)
+        log.info(f"Member (ID: {member_id}) not found during kick check. Likely left.")
+        await remove_member_from_db(guild.id, member_id)
     except discord.Forbidden:
-        print(f"{get_log_prefix()} ERROR: Bot lacks permission to fetch or kick member {member.name} (ID: {member.id}).")
+        log.error(f"Bot lacks permission to fetch or kick member (ID: {member_id}).")
     except Exception as e:
-        print(f"{get_log_prefix()} ERROR: Unexpected error in kick_if_not_verified for {member.name} (ID: {member.id}): {e}")
-    finally:
-        if member.id in pending_verification_tasks:
-            del pending_verification_tasks[member.id]
+        log.error(f"Unexpected error in check_member_verification for member (ID: {member_id}): {e}")
 
-# --- Event Handlers ---
-@client.event
-async def on_ready():
-    init_db()
-    print(f'{get_log_prefix()} Bot logged in as {client.user.name}')
-    await client.change_presence(activity=discord.Game(name=BOT_STATUS_MESSAGE), status=discord.Status.online)
-    print(f"{get_log_prefix()} Bot status set to '{BOT_STATUS_MESSAGE}'.")
+class PendingVerification:
+    """Compact record for one pending verification check."""
+    __slots__ = ('guild_id', 'member_id', 'deadline', 'waiting_since', 'state')
 
-    if WELCOME_CHANNEL_ID == 0: print(f"{get_log_prefix()} WARNING: WELCOME_CHANNEL_ID is not set.")
-    if not VERIFIED_ROLE_NAME: print(f"{get_log_prefix()} WARNING: VERIFIED_ROLE_NAME is not set.")
+    PENDING = 0 # Waiting for its deadline
+    CHECKING = 1 # Deadline passed, check in progress
+    CANCELLED = 2
 
-    # Get last online time from DB
-    last_online_db_time = get_last_online_time()
-    current_time = datetime.now(timezone.utc)
-    
-    # Determine the start of the catch-up window
+    def __init__(self, guild_id: int, member_id: int, deadline: float, waiting_since: float):
+        self.guild_id = guild_id
+        self.member_id = member_id
+        self.deadline = deadline
+        self.waiting_since = waiting_since # time.time() the member started waiting, usually their join
+        self.state = PendingVerification.PENDING
+
+class PendingVerificationIndex:
+    """Pending verifications grouped per guild: O(1) lookup by (guild_id, member_id)
+    and a cheap view of everything pending in one guild."""
+
+    def __init__(self):
+        self._by_guild = {} # guild_id -> {member_id: PendingVerification}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for records in self._by_guild.values():
+            yield from records.values()
+
+    def get(self, guild_id: int, member_id: int) -> PendingVerification | None:
+        records = self._by_guild.get(guild_id)
+        return records.get(member_id) if records else None
+
+    def add(self, record: PendingVerification):
+        records = self._by_guild.setdefault(record.guild_id, {})
+        if record.member_id not in records:
+            self._count += 1
+        records[record.member_id] = record
+
+    def remove(self, guild_id: int, member_id: int) -> PendingVerification | None:
+        records = self._by_guild.get(guild_id)
+        if not records or member_id not in records:
+            return None
+        record = records.pop(member_id)
+        self._count -= 1
+        if not records:
+            del self._by_guild[guild_id]
+        return record
+
+    def guild(self, guild_id: int):
+        """Read-only view of all pending records in a guild."""
+        return self._by_guild.get(guild_id, {}).values()
+
+    def guild_member_ids(self, guild_id: int):
+        """Set-like view of the member IDs pending in a guild."""
+        return self._by_guild.get(guild_id, {}).keys()
+
+    def guild_count(self) -> int:
+        return len(self._by_guild)
+
+    def memory_bytes(self) -> int:
+        """Approximate bytes held by the index (dicts and records, not the shared int objects)."""
+        total = sys.getsizeof(self._by_guild)
+        for records in self._by_guild.values():
+            total += sys.getsizeof(records)
+            if records:
+                total += len(records) * sys.getsizeof(next(iter(records.values())))
+        return total
+
+class VerificationScheduler:
+    """Single deadline heap for every pending verification check, replacing one sleeping task
+    per member. Scheduling is a heap push, cancelling marks the record (stale heap entries
+    are skipped when popped), and one worker processes due checks in batches. Deadlines are
+    wall-clock timestamps persisted to pending_verifications so they survive restarts exactly."""
+
+    def __init__(self, flush_seconds: float):
+        self.flush_seconds = flush_seconds
+        self.index = PendingVerificationIndex()
+        self._heap = [] # (deadline, seq, PendingVerification)
+        self._seq = 0
+        self._dirty = {} # (guild_id, member_id) -> (deadline, waiting_since), or None for a delete, not yet persisted
+        self._wakeup = asyncio.Event()
+        self._worker = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key: tuple[int, int]) -> bool:
+        return self.index.get(*key) is not None
+
+    def stats(self) -> dict:
+        return {'pending': len(self.index), 'guilds': self.index.guild_count(),
+                'heap_entries': len(self._heap), 'memory_bytes': self.index.memory_bytes() + sys.getsizeof(self._heap)}
+
+    def _push(self, guild_id: int, member_id: int, deadline: float, waiting_since: float):
+        record = PendingVerification(guild_id, member_id, deadline, waiting_since)
+        self.index.add(record)
+        self._seq += 1
+        heapq.heappush(self._heap, (deadline, self._seq, record))
+        if self._heap[0][2] is record:
+            self._wakeup.set() # New earliest deadline, re-arm the worker's timer
+
+    def schedule(self, guild_id: int, member_id: int, deadline: float, waiting_since: float | None = None) -> bool:
+        """Schedules a check at the given time.time() deadline. waiting_since (default: now) is when
+        the member started waiting, for the age metric. Returns False if one is already pending."""
+        if self.index.get(guild_id, member_id) is not None:
+            return False
+        if waiting_since is None:
+            waiting_since = time.time()
+        self._push(guild_id, member_id, deadline, waiting_since)
+        self._dirty[(guild_id, member_id)] = (deadline, waiting_since)
+        return True
+
+    def cancel(self, guild_id: int, member_id: int) -> bool:
+        """Cancels a pending (or in-progress) check. Returns True if one existed."""
+        record = self.index.remove(guild_id, member_id)
+        if record is None:
+            return False
+        record.state = PendingVerification.CANCELLED
+        self._dirty[(guild_id, member_id)] = None
+        if len(self._heap) > 2 * len(self.index) + 64: # Too many stale entries, rebuild
+            self._heap = [entry for entry in self._heap if entry[2].state == PendingVerification.PENDING]
+            heapq.heapify(self._heap)
+        return True
+
+    def _pop_due(self, now: float, limit: int) -> list[PendingVerification]:
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < limit:
+            record = heapq.heappop(self._heap)[2]
+            if record.state != PendingVerification.PENDING:
+                continue # Cancelled
+            record.state = PendingVerification.CHECKING
+            due.append(record)
+        return due
+
+    async def _check(self, record: PendingVerification):
+        try:
+            await check_member_verification(record.guild_id, record.member_id, record)
+        finally:
+            if self.index.get(record.guild_id, record.member_id) is record:
+                self.index.remove(record.guild_id, record.member_id)
+                self._dirty[(record.guild_id, record.member_id)] = None
+
+    def _take_dirty(self) -> tuple[list[tuple], list[tuple]]:
+        dirty, self._dirty = self._dirty, {}
+        upserts = [(g_id, m_id, *values) for (g_id, m_id), values in dirty.items() if values is not None]
+        deletes = [key for key, values in dirty.items() if values is None]
+        return upserts, deletes
+
+    async def persist(self) -> bool:
+        """Returns False if the DB write failed (the changes are kept for the next attempt)."""
+        if not self._dirty:
+            return True
+        dirty = self._dirty
+        upserts, deletes = self._take_dirty()
+        try:
+            await db.run(_apply_pending_verification_writes, upserts, deletes)
+            return True
+        except sqlite3.Error as e:
+            log.error(f"DB error persisting {len(upserts) + len(deletes)} pending verification changes: {e}")
+            for key, values in dirty.items():
+                self._dirty.setdefault(key, values)
+            return False
+
+    def persist_blocking(self) -> bool:
+        if not self._dirty:
+            return True
+        upserts, deletes = self._take_dirty()
+        try:
+            db.run_blocking(_apply_pending_verification_writes, upserts, deletes)
+            return True
+        except sqlite3.Error as e:
+            log.error(f"DB error persisting pending verifications on shutdown: {e}")
+            return False
+
+    async def load(self):
+        """Restores deadlines saved by a previous run. Overdue ones are processed immediately."""
+        try:
+            rows = await db.run(_get_pending_verifications)
+        except sqlite3.Error as e:
+            log.error(f"DB error loading pending verifications: {e}")
+            return
+        restored = 0
+        for guild_id, member_id, deadline, waiting_since in rows:
+            if not owns_guild(guild_id):
+                continue # Another process's shard checks this one
+            if self.index.get(guild_id, member_id) is None:
+                if waiting_since is None: # Saved before waiting_since was tracked
+                    waiting_since = deadline - VERIFICATION_TIMEOUT_SECONDS
+                self._push(guild_id, member_id, deadline, waiting_since)
+                restored += 1
+        log.info(f"Restored {restored} pending verification checks from DB.")
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            due = self._pop_due(time.time(), VERIFICATION_BATCH_SIZE)
+            if due:
+                await asyncio.gather(*(self._check(record) for record in due))
+            await self.persist()
+            if due:
+                continue
+            timeout = self.flush_seconds
+            if self._heap:
+                timeout = min(timeout, max(0.0, self._heap[0][0] - time.time()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+verification_scheduler = VerificationScheduler(WRITE_BUFFER_FLUSH_SECONDS)
+
+def collect_pending_verification_metrics():
+    now = time.time()
+    PENDING_VERIFICATION_AGE.clear()
+    age_histogram = PENDING_VERIFICATION_AGE.labels()
+    for record in verification_scheduler.index:
+        age_histogram.observe(max(0.0, now - record.waiting_since))
+    stats = verification_scheduler.stats()
+    PENDING_VERIFICATIONS.set(stats['pending'])
+    PENDING_VERIFICATION_MEMORY.set(stats['memory_bytes'])
+    KICK_QUEUE_DEPTH.set(kick_executor.stats()['queue_depth'])
+
+metrics.add_collector(collect_pending_verification_metrics)
+
+# --- Offline Catch-up ---
+CATCHUP_PAGE_SIZE = 1000
+FETCH_MEMBERS_PAGE_SIZE = 1000 # Members per fetch_members request in discord.py; pages must line up with its requests to be sorted
+USER_LOOKUP_CONCURRENCY = 5 # Parallel fetch_user calls when resolving offline leavers
+USER_NAME_CACHE_SIZE = 10000
+QUERY_MEMBERS_BATCH_SIZE = 100 # Most user IDs Discord accepts in one gateway member request
+user_name_cache = collections.OrderedDict() # user_id -> display name, most recently used last
+
+async def resolve_user_name(user_id: int, semaphore: asyncio.Semaphore) -> str | None:
+    """Display name for a user who is no longer in the guild: local cache, then the client's
+    user cache, then a bounded-concurrency fetch_user."""
+    name = user_name_cache.get(user_id)
+    if name is None:
+        user = client.get_user(user_id)
+        if user is None:
+            async with semaphore:
+                try:
+                    user = await client.fetch_user(user_id)
+                except discord.NotFound:
+                    log.warning(f"Could not fetch user info for ID {user_id} (left offline, user deleted?).")
+                    return None
+                except Exception as e:
+                    log.error(f"Error fetching user {user_id} who left offline: {e}")
+                    return None
+        name = user.display_name
+    user_name_cache[user_id] = name
+    user_name_cache.move_to_end(user_id)
+    if len(user_name_cache) > USER_NAME_CACHE_SIZE:
+        user_name_cache.popitem(last=False)
+    return name
+
+async def iter_member_pages(guild: discord.Guild):
+    """Yields the guild's members in pages, in ascending member ID order. Uses the gateway
+    member cache when the guild has been chunked, and only falls back to REST pagination
+    (fetch_members) when it has not. Discord's REST pages cover disjoint, ascending ID ranges,
+    but discord.py yields each page reversed, so every page is sorted before it is yielded."""
+    if guild.chunked:
+        members = sorted(guild.members, key=lambda member: member.id)
+        for i in range(0, len(members), CATCHUP_PAGE_SIZE):
+            yield members[i:i + CATCHUP_PAGE_SIZE]
+        return
+    page = []
+    async for member in guild.fetch_members(limit=None):
+        page.append(member)
+        if len(page) >= FETCH_MEMBERS_PAGE_SIZE:
+            page.sort(key=lambda member: member.id)
+            yield page
+            page = []
+    if page:
+        page.sort(key=lambda member: member.id)
+        yield page
+
+async def cache_pending_members(guild: discord.Guild):
+    """Lean member cache only: loads members with a pending verification check into the member
+    cache after catch-up, so getting the role still reaches on_member_update. Nobody else in
+    the guild is cached."""
+    member_ids = [member_id for member_id in verification_scheduler.index.guild_member_ids(guild.id) if guild.get_member(member_id) is None]
+    for i in range(0, len(member_ids), QUERY_MEMBERS_BATCH_SIZE):
+        batch = member_ids[i:i + QUERY_MEMBERS_BATCH_SIZE]
+        try:
+            await guild.query_members(user_ids=batch, limit=len(batch), cache=True)
+        except asyncio.TimeoutError:
+            log.warning(f"Timed out caching {len(batch)} pending members of guild {guild.name} (ID: {guild.id}).")
+    if member_ids:
+        log.info(f"Cached {len(member_ids)} members with pending verification in guild {guild.name}.")
+
+async def merge_members_with_snapshot(guild: discord.Guild):
+    """Sorted set-diff of the live member stream against member_snapshot. Yields pages of
+    (member, snapshot_verified) pairs, where snapshot_verified is None for members missing
+    from the snapshot, followed by the IDs of snapshot rows with no live member, as
+    (members, departed) tuples. Both sides are streamed, so memory is bounded by the page size."""
+    snapshot = iter_member_snapshot(guild.id, CATCHUP_PAGE_SIZE)
+    row = await anext(snapshot, None)
+    async for page in iter_member_pages(guild):
+        members, departed = [], []
+        for member in page:
+            while row is not None and row[0] < member.id:
+                departed.append(row)
+                row = await anext(snapshot, None)
+            if row is not None and row[0] == member.id:
+                members.append((member, bool(row[1])))
+                row = await anext(snapshot, None)
+            else:
+                members.append((member, None))
+        yield members, departed
+    departed = []
+    while row is not None:
+        departed.append(row)
+        if len(departed) >= CATCHUP_PAGE_SIZE:
+            yield [], departed
+            departed = []
+        row = await anext(snapshot, None)
+    if departed:
+        yield [], departed
+
+async def catch_up_guild(guild: discord.Guild, catchup_start_time: datetime, current_time: datetime):
+    """Single streaming merge of a guild's members against member_snapshot. Each live member is
+    classified once as seed (verified, not yet in DB), welcome (verified while offline), age-kick
+    or schedule-check, snapshot rows with no live member are leavers, and DB writes are issued
+    in bulk per page."""
+    log.info(f"Processing guild: {guild.name} (ID: {guild.id})")
+    config = guild_configs.get(guild)
+    if config.verified_role_id is None:
+        log.warning(f"Verified role '{config.verified_role_name}' not found in guild '{guild.name}'.")
+        return
+
+    # Buffered writes are flushed first so the merge runs against an up-to-date snapshot.
+    await flush_write_buffers()
+    verified_index.begin_rebuild(guild.id)
+    verified_during_downtime_members_to_welcome = [] # For batch welcome
+    departed_verified_ids = []
+    departed_count = 0
+
+    async for members, departed in merge_members_with_snapshot(guild):
+        new_rows = [] # Members missing from the snapshot
+        seed_ids = []
+        candidates = {} # Unverified members who joined while offline, by ID
+        verified_ids = [] # Ascending, like the merge itself
+        for member, snapshot_verified in members:
+            if snapshot_verified is None:
+                new_rows.append((member.id, member.joined_at.timestamp() if member.joined_at else None, False))
+            if snapshot_verified:
+                verified_ids.append(member.id)
+            if member.bot: continue
+            joined_while_offline = member.joined_at is not None and member.joined_at.astimezone(timezone.utc) >= catchup_start_time
+
+            # Already verified by role: make sure they are in the DB and welcome them if they joined offline.
+            if config.is_verified(member):
+                if not snapshot_verified:
+                    seed_ids.append(member.id)
+                    verified_ids.append(member.id)
+                    if DEBUG_LOGGING: log.debug(f"Added existing verified member {member.name} (ID: {member.id}) to DB.")
+                if joined_while_offline:
+                    verified_during_downtime_members_to_welcome.append(member)
+                continue
+
+            # Member joined while bot was online, or before catch-up window, and is not verified, so no action needed here.
+            if joined_while_offline:
+                candidates[member.id] = member
+
+        merged_up_to = max(members[-1][0].id if members else 0, departed[-1][0] if departed else 0)
+        verified_index.extend_rebuild(guild.id, verified_ids, merged_up_to)
+        # New rows go in before the seeds so the verified flag lands on top of the recorded joined_at.
+        await snapshot_buffer.upsert_many(guild.id, new_rows)
+        await mark_members_verified_in_db(guild.id, seed_ids)
+
+        if departed:
+            departed_count += len(departed)
+            departed_verified_ids.extend(member_id for member_id, verified in departed if verified)
+            await remove_members_from_db(guild.id, [member_id for member_id, _ in departed])
+
+        if not candidates:
+            continue
+
+        # Members with a deadline persisted by the previous run are skipped and keep that exact deadline.
+        kick_ids, schedule_ids, _ = screen_member_ids(candidates, config.age_screen.cutoff(), verification_scheduler.index.guild_member_ids(guild.id))
+
+        # No pre-kick fetch: a member who already left just makes the kick fail with NotFound.
+        for member_id in kick_ids:
+            member = candidates[member_id]
+            age_kick_reason = f"Account too new (created {account_age_days(member_id)} days ago, min {config.min_account_age_days} days). Found during catch-up."
+            if DEBUG_LOGGING: log.debug(f"Kicking member {member.name} (ID: {member.id}) for age during catch-up.")
+            kick_executor.submit(member, age_kick_reason)
+
+        # If they are not verified, but also not too young, and joined while offline, schedule a check
+        for member_id in schedule_ids:
+            member = candidates[member_id]
+            time_since_joined = current_time - member.joined_at.astimezone(timezone.utc)
+            remaining_time = config.verification_timeout_seconds - time_since_joined.total_seconds()
+
+            if remaining_time > 0:
+                if DEBUG_LOGGING: log.debug(f"Member {member.name} (ID: {member.id}) joined offline, not verified. Scheduling check. Remaining time: {remaining_time:.1f}s.")
+            else:
+                # If remaining_time is 0 or negative, the scheduler checks them on its next wake-up
+                if DEBUG_LOGGING: log.debug(f"Member {member.name} (ID: {member.id}) joined offline, not verified, and verification timeout already passed.")
+            verification_scheduler.schedule(guild.id, member.id, time.time() + max(0.0, remaining_time), member.joined_at.timestamp())
+
+    verified_index.finish_rebuild(guild.id)
+
+    # --- Send Batch Welcome for current members verified during downtime ---
+    if config.welcome_channel_id != 0 and config.welcome_template and verified_during_downtime_members_to_welcome:
+        target_welcome_channel = config.welcome_channel
+        if target_welcome_channel:
+            # Queued without awaiting in between, so the dispatcher renders them as one batch.
+            for member_to_welcome in verified_during_downtime_members_to_welcome:
+                single_message = config.welcome_template.render(member_mention=member_to_welcome.mention)
+                message_dispatcher.welcome(target_welcome_channel, member_to_welcome.mention, single_message, config.batch_welcome_template)
+            log.info(f"Queued welcome for {len(verified_during_downtime_members_to_welcome)} members verified offline in {guild.name}.")
+        else: log.warning(f"Welcome channel {config.welcome_channel_id} not found in {guild.name} for batch welcome.")
+
+    if not departed_count:
+        return
+    log.info(f"Removed {departed_count} members ({len(departed_verified_ids)} verified) who left guild {guild.name} while bot was offline.")
+    if not departed_verified_ids:
+        return
+
+    # --- Send Batch Goodbye for verified members who left during downtime ---
+    target_goodbye_channel = config.welcome_channel # Using WELCOME_CHANNEL_ID for goodbyes too
+    if not target_goodbye_channel or not config.goodbye_template:
+        if config.welcome_channel_id != 0 and not target_goodbye_channel: log.warning(f"Goodbye channel {config.welcome_channel_id} not found in {guild.name} for offline leavers.")
+        return
+    semaphore = asyncio.Semaphore(USER_LOOKUP_CONCURRENCY)
+    names = await asyncio.gather(*(resolve_user_name(user_id, semaphore) for user_id in departed_verified_ids))
+    left_names = [name for name in names if name is not None]
+    for name in left_names:
+        single_goodbye_msg = config.goodbye_template.render(member_name=name)
+        message_dispatcher.goodbye(target_goodbye_channel, name, single_goodbye_msg, config.batch_goodbye_template)
+    if left_names:
+        log.info(f"Queued goodbye for {len(left_names)} members who left {guild.name} offline.")
+
+async def run_guild_catch_up(guild: discord.Guild, catchup_start_time: datetime, current_time: datetime,
+                             semaphore: asyncio.Semaphore, progress: dict, total: int):
+    """Runs catch_up_guild under the shared concurrency limit. Failures are logged and contained
+    so one bad guild cannot stall or abort the others."""
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            await catch_up_guild(guild, catchup_start_time, current_time)
+            if MEMBER_CACHE == 'lean':
+                await cache_pending_members(guild)
+            checkpoint_heartbeat.mark_live(guild)
+        except Exception as e:
+            verified_index.cancel_rebuild(guild.id)
+            progress['failed'] += 1
+            log.error(f"Catch-up failed for guild {guild.name} (ID: {guild.id}): {e}")
+        finally:
+            progress['done'] += 1
+            CATCHUP_DURATION.labels(guild.id).set(time.perf_counter() - started)
+            log.info(f"Catch-up for guild {guild.name} (ID: {guild.id}) took {time.perf_counter() - started:.1f}s ({progress['done']}/{total} guilds).")
+
+async def get_catchup_start_time(current_time: datetime) -> datetime:
+    """Start of the catch-up window for guilds without a checkpoint of their own."""
+    last_online_db_time = await get_last_online_time()
     # If last_online_db_time is available, use it. Otherwise, use current time minus OFFLINE_CATCHUP_WINDOW_SECONDS
     catchup_start_time = current_time - timedelta(seconds=OFFLINE_CATCHUP_WINDOW_SECONDS)
     if last_online_db_time:
         # Use the later of (last_online_db_time) or (current_time - OFFLINE_CATCHUP_WINDOW_SECONDS)
         # This ensures we don't try to catch up on an excessively long period if the bot was offline for a very long time
         catchup_start_time = max(last_online_db_time, catchup_start_time)
-        print(f"{get_log_prefix()} Using last online time from DB ({last_online_db_time}) for catch-up.")
+        log.info(f"Using last online time from DB ({last_online_db_time}) for catch-up.")
     else:
-        print(f"{get_log_prefix()} No last online time found in DB. Using fallback catch-up window of {OFFLINE_CATCHUP_WINDOW_SECONDS} seconds.")
+        log.info(f"No last online time found in DB. Using fallback catch-up window of {OFFLINE_CATCHUP_WINDOW_SECONDS} seconds.")
+    return catchup_start_time
 
-    print(f"{get_log_prefix()} Starting offline member catch-up process for events since: {catchup_start_time} UTC")
+# --- Event Handlers ---
+@client.event
+async def on_ready():
+    await init_db()
+    await guild_settings.reload()
+    guild_settings.start()
+    write_buffer.start()
+    snapshot_buffer.start()
+    await verification_scheduler.load()
+    verification_scheduler.start()
+    await start_metrics()
+    log.info(f'Bot logged in as {client.user.name}')
+    await client.change_presence(activity=discord.Game(name=BOT_STATUS_MESSAGE), status=discord.Status.online)
+    log.info(f"Bot status set to '{BOT_STATUS_MESSAGE}'.")
 
-    for guild in client.guilds:
-        print(f"{get_log_prefix()} Processing guild: {guild.name} (ID: {guild.id})")
-        verified_role = discord.utils.get(guild.roles, name=VERIFIED_ROLE_NAME)
-        if not verified_role:
-            print(f"{get_log_prefix()} WARNING: Verified role '{VERIFIED_ROLE_NAME}' not found in guild '{guild.name}'.")
-            continue
+    if WELCOME_CHANNEL_ID == 0: log.warning("WELCOME_CHANNEL_ID is not set.")
+    if not VERIFIED_ROLE_NAME: log.warning("VERIFIED_ROLE_NAME is not set.")
 
-        current_guild_member_ids = set()
-        verified_during_downtime_members_to_welcome = [] # For batch welcome
-
-        # --- NEW LOGIC: Check for initial DB population for verified members ---
-        # Check if there are any verified members already recorded for this guild
-        existing_verified_members_in_db = get_all_verified_member_ids_from_db(guild.id)
-        if not existing_verified_members_in_db: # If DB is empty for this guild
-            print(f"{get_log_prefix()} DB for guild {guild.name} (ID: {guild.id}) appears empty. Populating with existing verified members.")
-            if verified_role:
-                async for member in guild.fetch_members(limit=None):
-                    if not member.bot and verified_role in member.roles:
-                        mark_member_verified_in_db(guild.id, member.id)
-                        print(f"{get_log_prefix()} Added existing verified member {member.name} (ID: {member.id}) to DB.")
-            else:
-                print(f"{get_log_prefix()} WARNING: Verified role '{VERIFIED_ROLE_NAME}' not found in guild '{guild.name}', cannot initially populate verified members.")
-        else:
-            print(f"{get_log_prefix()} DB for guild {guild.name} (ID: {guild.id}) already contains verified members. Skipping initial population.")
-        # --- END NEW LOGIC ---
+    # Determine the start of the catch-up window from the last online time in the DB
+    current_time = datetime.now(timezone.utc)
+    catchup_start_time = await get_catchup_start_time(current_time)
 
-        # --- Pass 1: Process current members ---
-        async for member in guild.fetch_members(limit=None):
-            current_guild_member_ids.add(member.id)
-            if member.bot: continue
+    # Guilds with a checkpoint only catch up the exact gap since they were last processed.
+    guild_checkpoints = await get_guild_checkpoints()
+    log.info(f"Starting offline member catch-up process for events since: {catchup_start_time} UTC ({len(guild_checkpoints)} guilds have their own checkpoint)")
 
-            # Check if the member is already verified by their roles.
-            # If they are, skip the age check and any potential kick for age,
-            # and ensure they are marked in DB and welcomed if they joined offline.
-            has_verified_role_now = verified_role in member.roles
-            if has_verified_role_now:
-                # If they have the role, ensure they are in the DB and consider for batch welcome
-                print(f"{get_log_prefix()} Member {member.name} (ID: {member.id}) has verified role. Ensuring DB record and checking for offline welcome.")
-                mark_member_verified_in_db(guild.id, member.id)
-                # Only add to welcome list if they joined *after* the bot was last online
-                if member.joined_at and member.joined_at.astimezone(timezone.utc) >= catchup_start_time:
-                    verified_during_downtime_members_to_welcome.append(member)
-                continue # Skip all other checks for this member as they are already verified.
-
-            # If they don't have the verified role, proceed with age check and timeout
-            account_age = current_time - member.created_at
-            
-            # Check if member joined while bot was offline AND if their account age is too new
-            if member.joined_at and member.joined_at.astimezone(timezone.utc) >= catchup_start_time:
-                if account_age.days < MIN_ACCOUNT_AGE_DAYS:
-                    try:
-                        # Re-fetch to ensure member is still present before kicking
-                        await guild.fetch_member(member.id) 
-                        age_kick_reason = f"Account too new (created {account_age.days} days ago, min {MIN_ACCOUNT_AGE_DAYS} days). Found during catch-up."
-                        print(f"{get_log_prefix()} Kicking member {member.name} (ID: {member.id}) for age during catch-up.")
-                        await kick_member(member, age_kick_reason)
-                    except discord.NotFound:
-                        print(f"{get_log_prefix()} Member {member.name} (ID: {member.id}) for age check already left.")
-                    except Exception as e:
-                         print(f"{get_log_prefix()} Error during age kick for {member.name} (ID: {member.id}): {e}")
-                    continue # Move to next member if kicked or already left
-
-                # If they are not verified, but also not too young, and joined while offline, schedule a check
-                if member.id not in pending_verification_tasks:
-                    time_since_joined = current_time - member.joined_at.astimezone(timezone.utc)
-                    remaining_time = VERIFICATION_TIMEOUT_SECONDS - time_since_joined.total_seconds()
-                    
-                    if remaining_time > 0:
-                        print(f"{get_log_prefix()} Member {member.name} (ID: {member.id}) joined offline, not verified. Scheduling check. Remaining time: {remaining_time:.1f}s.")
-                        task = asyncio.create_task(kick_if_not_verified(member, initial_delay_seconds=remaining_time))
-                        pending_verification_tasks[member.id] = task
-                    else:
-                        # If remaining_time is 0 or negative, kick immediately if not verified
-                        print(f"{get_log_prefix()} Member {member.name} (ID: {member.id}) joined offline, not verified, and verification timeout already passed.")
-                        await kick_if_not_verified(member, initial_delay_seconds=0) # Perform immediate check
-            else:
-                # Member joined while bot was online, or before catch-up window, and is not verified, so no action needed here.
-                pass 
-        
-        # --- Send Batch Welcome for current members verified during downtime ---
-        if WELCOME_CHANNEL_ID != 0 and verified_during_downtime_members_to_welcome:
-            target_welcome_channel = guild.get_channel(WELCOME_CHANNEL_ID)
-            if target_welcome_channel and isinstance(target_welcome_channel, discord.TextChannel):
-                if len(verified_during_downtime_members_to_welcome) > 1:
-                    mentions = ", ".join([m.mention for m in verified_during_downtime_members_to_welcome])
-                    try:
-                        batch_message = BATCH_WELCOME_MESSAGE.format(member_mentions_list=mentions, guild_name=guild.name)
-                        await target_welcome_channel.send(batch_message)
-                        print(f"{get_log_prefix()} Sent batch welcome for {len(verified_during_downtime_members_to_welcome)} members in {guild.name}.")
-                    except Exception as e: print(f"{get_log_prefix()} ERROR sending batch welcome: {e}")
-                elif len(verified_during_downtime_members_to_welcome) == 1:
-                    member_to_welcome = verified_during_downtime_members_to_welcome[0]
-                    specific_channel_mention_str = ""
-                    if MENTION_CHANNEL_NAME:
-                        tmc_obj = discord.utils.get(guild.text_channels, name=MENTION_CHANNEL_NAME)
-                        specific_channel_mention_str = tmc_obj.mention if tmc_obj else f"#{MENTION_CHANNEL_NAME}"
-                    try:
-                        single_message = WELCOME_MESSAGE.format(
-                            member_mention=member_to_welcome.mention, guild_name=guild.name, specific_channel_mention=specific_channel_mention_str)
-                        await target_welcome_channel.send(single_message)
-                        print(f"{get_log_prefix()} Sent individual welcome (batch logic) for {member_to_welcome.name} (ID: {member_to_welcome.id}).")
-                    except Exception as e: print(f"{get_log_prefix()} ERROR sending single welcome (batch logic) for {member_to_welcome.name}: {e}")
-            else: print(f"{get_log_prefix()} WARNING: Welcome channel {WELCOME_CHANNEL_ID} not found in {guild.name} for batch welcome.")
-
-        # --- Pass 2: Process verified members who left while bot was offline ---
-        db_verified_ids = get_all_verified_member_ids_from_db(guild.id)
-        left_verified_user_objects = []
-
-        for member_id_in_db in db_verified_ids:
-            if member_id_in_db not in current_guild_member_ids:
-                # This member was verified but is no longer in the guild
-                try:
-                    user = await client.fetch_user(member_id_in_db) # Fetch user object for name
-                    left_verified_user_objects.append(user)
-                    print(f"{get_log_prefix()} Verified member {user.name} (ID: {user.id}) left guild {guild.name} while bot was offline.")
-                except discord.NotFound:
-                    print(f"{get_log_prefix()} Could not fetch user info for ID {member_id_in_db} (left offline, user deleted?).")
-                    # Still remove from DB as they are not in guild
-                except Exception as e:
-                    print(f"{get_log_prefix()} Error fetching user {member_id_in_db} who left offline: {e}")
-                
-                # Remove from DB regardless of whether user object could be fetched, as they are not in guild
-                remove_member_from_db(guild.id, member_id_in_db)
-
-        # --- Send Batch Goodbye for verified members who left during downtime ---
-        if WELCOME_CHANNEL_ID != 0 and left_verified_user_objects: # Using WELCOME_CHANNEL_ID for goodbyes too
-            target_goodbye_channel = guild.get_channel(WELCOME_CHANNEL_ID)
-            if target_goodbye_channel and isinstance(target_goodbye_channel, discord.TextChannel):
-                if len(left_verified_user_objects) > 1:
-                    names_list = ", ".join([u.display_name for u in left_verified_user_objects])
-                    try:
-                        batch_goodbye_msg = BATCH_GOODBYE_MESSAGE.format(member_names_list=names_list, guild_name=guild.name)
-                        await target_goodbye_channel.send(batch_goodbye_msg)
-                        print(f"{get_log_prefix()} Sent batch goodbye for {len(left_verified_user_objects)} members who left {guild.name} offline.")
-                    except Exception as e: print(f"{get_log_prefix()} ERROR sending batch goodbye: {e}")
-                elif len(left_verified_user_objects) == 1:
-                    user_who_left = left_verified_user_objects[0]
-                    try:
-                        single_goodbye_msg = GOODBYE_MESSAGE.format(member_name=user_who_left.display_name, guild_name=guild.name)
-                        await target_goodbye_channel.send(single_goodbye_msg)
-                        print(f"{get_log_prefix()} Sent individual goodbye (offline logic) for {user_who_left.display_name} (ID: {user_who_left.id}).")
-                    except Exception as e: print(f"{get_log_prefix()} ERROR sending single goodbye (offline logic) for {user_who_left.display_name}: {e}")
-            else: print(f"{get_log_prefix()} WARNING: Goodbye channel {WELCOME_CHANNEL_ID} not found in {guild.name} for offline leavers.")
+    checkpoint_heartbeat.pause() # Nothing advances until each guild has been caught up again
+    guilds = list(client.guilds)
+    semaphore = asyncio.Semaphore(max(1, CATCHUP_CONCURRENCY))
+    progress = {'done': 0, 'failed': 0}
+    started = time.perf_counter()
+    await asyncio.gather(*(run_guild_catch_up(guild, guild_checkpoints.get(guild.id, catchup_start_time), current_time, semaphore, progress, len(guilds))
+                           for guild in guilds))
 
-    print(f"{get_log_prefix()} Offline member catch-up finished.")
-    update_last_online_time() # Update last online time after catch-up
+    log.info(f"Offline member catch-up finished for {len(guilds)} guilds in {time.perf_counter() - started:.1f}s ({progress['failed']} failed).")
+    await update_last_online_time() # Update last online time after catch-up
+    await checkpoint_heartbeat.checkpoint()
+    checkpoint_heartbeat.start()
+
+@client.event
+async def on_disconnect():
+    if isinstance(client, discord.AutoShardedClient):
+        return # Handled per shard by on_shard_disconnect
+    checkpoint_heartbeat.pause()
 
 @client.event
+async def on_resumed():
+    if isinstance(client, discord.AutoShardedClient):
+        return # Handled per shard by on_shard_resumed, other shards may still be down
+    # A resumed session replays the events missed while disconnected, so there is no gap to catch up.
+    checkpoint_heartbeat.resume(client.guilds)
+    log.info("Gateway session resumed, guild checkpoints advancing again.")
+
+@client.event
+async def on_shard_disconnect(shard_id: int):
+    checkpoint_heartbeat.pause(shard_id)
+
+@client.event
+async def on_shard_resumed(shard_id: int):
+    checkpoint_heartbeat.resume(guild for guild in client.guilds if guild.shard_id == shard_id)
+
+@client.event
+async def on_shard_ready(shard_id: int):
+    # An AutoShardedClient only dispatches on_ready once. A shard that re-identifies after losing
+    # its session gets a fresh READY without the missed events, so its guilds catch up from their checkpoints.
+    if not checkpoint_heartbeat.started:
+        return # Initial connect, on_ready catches up every guild
+    guilds = [guild for guild in client.guilds if guild.shard_id == shard_id]
+    current_time = datetime.now(timezone.utc)
+    catchup_start_time = await get_catchup_start_time(current_time)
+    guild_checkpoints = await get_guild_checkpoints()
+    log.info(f"Shard {shard_id} re-identified, catching up {len(guilds)} guilds.")
+    semaphore = asyncio.Semaphore(max(1, CATCHUP_CONCURRENCY))
+    progress = {'done': 0, 'failed': 0}
+    await asyncio.gather(*(run_guild_catch_up(guild, guild_checkpoints.get(guild.id, catchup_start_time), current_time, semaphore, progress, len(guilds))
+                           for guild in guilds))
+    log.info(f"Catch-up for shard {shard_id} finished ({progress['failed']} failed).")
+
+@client.event
+async def on_guild_join(guild: discord.Guild):
+    checkpoint_heartbeat.mark_live(guild)
+
+@client.event
+async def on_guild_remove(guild: discord.Guild):
+    verified_index.forget(guild.id)
+    await checkpoint_heartbeat.forget(guild.id)
+
+@client.event
+@instrument_handler
 async def on_member_join(member: discord.Member):
-    print(f"{get_log_prefix()} Member joined (bot online): {member.name} (ID: {member.id})")
-    account_age = datetime.now(timezone.utc) - member.created_at
-    if account_age.days < MIN_ACCOUNT_AGE_DAYS:
-        age_kick_reason = f"Account too new (created {account_age.days} days ago, min {MIN_ACCOUNT_AGE_DAYS} days)."
-        await kick_member(member, age_kick_reason)
+    raid = raid_monitor.record_join(member.guild)
+    if not raid:
+        log.info(f"Member joined (bot online): {member.name} (ID: {member.id})")
+    await record_member_joined(member)
+    config = guild_configs.get(member.guild)
+    screen = raid_age_screen(member.guild) if raid else config.age_screen
+    if screen.is_too_new(member.id):
+        age_kick_reason = f"Account too new (created {account_age_days(member.id)} days ago, min {screen.min_age_days} days)."
+        if raid:
+            age_kick_reason += " Raid mode."
+            raid_monitor.record_kick(member.guild.id)
+        kick_executor.submit(member, age_kick_reason)
         return
 
-    if member.id not in pending_verification_tasks:
-        task = asyncio.create_task(kick_if_not_verified(member))
-        pending_verification_tasks[member.id] = task
-        print(f"{get_log_prefix()} Scheduled verification task for {member.name} (ID: {member.id}). Timeout: {VERIFICATION_TIMEOUT_SECONDS}s.")
+    if verification_scheduler.schedule(member.guild.id, member.id, time.time() + config.verification_timeout_seconds):
+        if not raid: log.info(f"Scheduled verification check for {member.name} (ID: {member.id}). Timeout: {config.verification_timeout_seconds}s.")
     else:
-        print(f"{get_log_prefix()} Warning: Task already exists for {member.name} (ID: {member.id}) in on_member_join.")
+        log.warning(f"Verification check already pending for {member.name} (ID: {member.id}) in on_member_join.")
 
 @client.event
+@instrument_handler
 async def on_member_update(before: discord.Member, after: discord.Member):
     guild = after.guild
-    verified_role = discord.utils.get(guild.roles, name=VERIFIED_ROLE_NAME)
+    config = guild_configs.get(guild)
 
-    if not verified_role:
-        if after.id in pending_verification_tasks:
-             print(f"{get_log_prefix()} ERROR: Verified role '{VERIFIED_ROLE_NAME}' not found in {guild.name} for {after.name} (ID: {after.id}).")
+    if config.verified_role_id is None:
+        if (guild.id, after.id) in verification_scheduler:
+             log.error(f"Verified role '{config.verified_role_name}' not found in {guild.name} for {after.name} (ID: {after.id}).")
         return
 
-    was_verified_before = verified_role in before.roles
-    is_verified_now = verified_role in after.roles
+    was_verified_before = config.is_verified(before)
+    is_verified_now = config.is_verified(after)
 
     if not was_verified_before and is_verified_now:
-        print(f"{get_log_prefix()} Member {after.name} (ID: {after.id}) received '{VERIFIED_ROLE_NAME}' role.")
-        mark_member_verified_in_db(guild.id, after.id)
+        raid = raid_monitor.active(guild.id)
+        if not raid: log.info(f"Member {after.name} (ID: {after.id}) received '{config.verified_role_name}' role.")
+        await mark_member_verified_in_db(guild.id, after.id)
 
-        task = pending_verification_tasks.pop(after.id, None)
+        had_pending_check = verification_scheduler.cancel(guild.id, after.id)
+        if kick_executor.cancel(guild.id, after.id):
+            if not raid: log.info(f"Cancelled queued timeout kick for {after.name} (ID: {after.id}).")
+            had_pending_check = True
         welcome_sent_by_this_event = False
-        if task:
-            if not task.done():
-                task.cancel()
-                try: await task
-                except asyncio.CancelledError: print(f"{get_log_prefix()} Cancelled verification task for {after.name} (ID: {after.id}).")
-                except Exception as e: print(f"{get_log_prefix()} Exception awaiting cancelled task for {after.name}: {e}")
-            else: print(f"{get_log_prefix()} Verification task for {after.name} already done.")
-            
-            if WELCOME_CHANNEL_ID != 0:
-                target_welcome_channel = guild.get_channel(WELCOME_CHANNEL_ID)
-                if target_welcome_channel and isinstance(target_welcome_channel, discord.TextChannel):
+        if had_pending_check:
+            if not raid: log.info(f"Cancelled verification check for {after.name} (ID: {after.id}).")
+
+            if config.welcome_channel_id != 0 and config.welcome_template:
+                target_welcome_channel = config.welcome_channel
+                if target_welcome_channel:
                     try:
-                        specific_channel_mention_str = ""
-                        if MENTION_CHANNEL_NAME:
-                            tmc_obj = discord.utils.get(guild.text_channels, name=MENTION_CHANNEL_NAME)
-                            specific_channel_mention_str = tmc_obj.mention if tmc_obj else f"#{MENTION_CHANNEL_NAME}"
-                        
-                        formatted_welcome_message = WELCOME_MESSAGE.format(
-                            member_mention=after.mention, guild_name=guild.name, specific_channel_mention=specific_channel_mention_str)
-                        await target_welcome_channel.send(formatted_welcome_message)
-                        print(f"{get_log_prefix()} Sent welcome for {after.name} (ID: {after.id}) (on_member_update).")
+                        formatted_welcome_message = config.welcome_template.render(member_mention=after.mention)
+                        if raid_monitor.defer_welcome(guild.id, after.id, target_welcome_channel, after.mention, formatted_welcome_message, config.live_batch_welcome_template):
+                            if DEBUG_LOGGING: log.debug(f"Deferred welcome for {after.name} (ID: {after.id}) until raid mode ends.")
+                        else:
+                            message_dispatcher.welcome(target_welcome_channel, after.mention, formatted_welcome_message, config.live_batch_welcome_template)
+                            log.info(f"Queued welcome for {after.name} (ID: {after.id}) (on_member_update).")
                         welcome_sent_by_this_event = True
-                    except Exception as e: print(f"{get_log_prefix()} ERROR sending welcome (on_member_update) for {after.name}: {e}")
-                else: print(f"{get_log_prefix()} ERROR: Welcome channel {WELCOME_CHANNEL_ID} not found for {after.name}.")
-            else: print(f"{get_log_prefix()} Welcome channel ID not configured, skipping welcome for {after.name}.")
+                    except Exception as e: log.error(f"Error sending welcome (on_member_update) for {after.name}: {e}")
+                else: log.error(f"Welcome channel {config.welcome_channel_id} not found for {after.name}.")
+            else: log.info(f"Welcome channel ID not configured, skipping welcome for {after.name}.")
         
-        if not welcome_sent_by_this_event and not task :
-             print(f"{get_log_prefix()} Member {after.name} verified, no active kick task. Welcome likely handled by on_ready or not applicable.")
+        if not welcome_sent_by_this_event and not had_pending_check:
+             if DEBUG_LOGGING: log.debug(f"Member {after.name} verified, no active kick task. Welcome likely handled by on_ready or not applicable.")
 
-@client.event
-async def on_member_remove(member: discord.Member):
-    guild = member.guild
+async def handle_member_left(guild: discord.Guild, member: discord.abc.User, joined_at: datetime | None):
+    """Goodbye and cleanup for a member who left while the bot is online. joined_at is None when
+    it is unknown, and such members always get the standard goodbye."""
     member_id = member.id
     guild_id = guild.id
     
-    print(f"{get_log_prefix()} Member {member.display_name} (ID: {member_id}) left guild {guild.name} (ID: {guild_id}).")
-
-    task = pending_verification_tasks.pop(member_id, None)
-    if task: # Member left while a kick task was pending
-        if not task.done():
-            task.cancel()
-            try: await task
-            except asyncio.CancelledError: pass
-        print(f"{get_log_prefix()} Cancelled/removed pending task for leaving member {member.display_name} (ID: {member_id}).")
-        remove_member_from_db(guild_id, member_id) 
+    log.info(f"Member {member.display_name} (ID: {member_id}) left guild {guild.name} (ID: {guild_id}).")
+
+    if verification_scheduler.cancel(guild_id, member_id): # Member left while a kick check was pending
+        log.info(f"Cancelled pending verification check for leaving member {member.display_name} (ID: {member_id}).")
+        await remove_member_from_db(guild_id, member_id) 
         return # No goodbye if they were pending verification and left
 
     # If no task was pending, check DB if they were previously verified (for members leaving while bot is ONLINE)
-    member_was_verified_in_db_check = was_member_verified_in_db(guild_id, member_id)
+    member_was_verified_in_db_check = await was_member_verified_in_db(guild_id, member_id)
     
     if member_was_verified_in_db_check:
-        if WELCOME_CHANNEL_ID != 0:
-            target_goodbye_channel = guild.get_channel(WELCOME_CHANNEL_ID)
-            if target_goodbye_channel and isinstance(target_goodbye_channel, discord.TextChannel):
+        config = guild_configs.get(guild)
+        if config.welcome_channel_id != 0 and config.goodbye_template:
+            target_goodbye_channel = config.welcome_channel
+            if target_goodbye_channel:
                 try:
-                    # Check if the member left shortly after joining
-                    time_in_server = datetime.now(timezone.utc) - member.joined_at.astimezone(timezone.utc)
-                    goodbye_message_template = GOODBYE_MESSAGE
+                    goodbye_message_template = config.goodbye_template
                     log_reason = "standard leave"
 
-                    if QUICK_LEAVE_GOODBYE_MESSAGE and time_in_server.total_seconds() < QUICK_LEAVE_TIMEOUT_SECONDS:
-                        goodbye_message_template = QUICK_LEAVE_GOODBYE_MESSAGE
+                    # Check if the member left shortly after joining
+                    time_in_server = datetime.now(timezone.utc) - joined_at.astimezone(timezone.utc) if joined_at else None
+                    if config.quick_leave_goodbye_template and time_in_server is not None and time_in_server.total_seconds() < config.quick_leave_timeout_seconds:
+                        goodbye_message_template = config.quick_leave_goodbye_template
                         log_reason = "quick leave"
 
-                    formatted_goodbye_message = goodbye_message_template.format(member_name=member.display_name, guild_name=guild.name)
-                    await target_goodbye_channel.send(formatted_goodbye_message)
-                    print(f"{get_log_prefix()} Sent {log_reason} goodbye for verified member {member.display_name} (ID: {member_id}) (on_member_remove).")
-                except Exception as e: print(f"{get_log_prefix()} ERROR sending goodbye (on_member_remove) for {member.display_name}: {e}")
-            else: print(f"{get_log_prefix()} ERROR: Goodbye channel {WELCOME_CHANNEL_ID} not found for {member.display_name}.")
-        else: print(f"{get_log_prefix()} Welcome channel ID not configured, skipping goodbye for {member.display_name}.")
+                    formatted_goodbye_message = goodbye_message_template.render(member_name=member.display_name)
+                    message_dispatcher.goodbye(target_goodbye_channel, member.display_name, formatted_goodbye_message, config.live_batch_goodbye_template)
+                    log.info(f"Queued {log_reason} goodbye for verified member {member.display_name} (ID: {member_id}) (on_member_remove).")
+                except Exception as e: log.error(f"Error sending goodbye (on_member_remove) for {member.display_name}: {e}")
+            else: log.error(f"Goodbye channel {config.welcome_channel_id} not found for {member.display_name}.")
+        else: log.info(f"Welcome channel ID not configured, skipping goodbye for {member.display_name}.")
     else:
-        print(f"{get_log_prefix()} Member {member.display_name} (ID: {member_id}) left and was not recorded as verified in DB. No on_member_remove goodbye sent.")
+        if DEBUG_LOGGING: log.debug(f"Member {member.display_name} (ID: {member_id}) left and was not recorded as verified in DB. No on_member_remove goodbye sent.")
 
     # Final cleanup from DB, as they have left the server.
     # This is important because on_ready handles leavers found during startup.
     # on_member_remove handles leavers while bot is online.
-    remove_member_from_db(guild_id, member_id)
+    await remove_member_from_db(guild_id, member_id)
+
+@client.event
+@instrument_handler
+async def on_member_remove(member: discord.Member):
+    await handle_member_left(member.guild, member, member.joined_at)
+
+@client.event
+@instrument_handler
+async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+    # on_member_remove only fires for cached members, and with MEMBER_CACHE=lean most are not.
+    if isinstance(payload.user, discord.Member):
+        return # Cached, already handled by on_member_remove
+    guild = client.get_guild(payload.guild_id)
+    if guild is not None:
+        joined_at = await get_member_joined_at(guild.id, payload.user.id) # For the quick-leave goodbye
+        await handle_member_left(guild, payload.user, joined_at)
+
+@client.event
+async def on_guild_update(before: discord.Guild, after: discord.Guild):
+    guild_configs.invalidate(after.id) # guild_name is compiled into the templates
+
+@client.event
+async def on_guild_role_create(role: discord.Role):
+    guild_configs.invalidate(role.guild.id)
+
+@client.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    guild_configs.invalidate(after.guild.id)
+
+@client.event
+async def on_guild_role_delete(role: discord.Role):
+    guild_configs.invalidate(role.guild.id)
+
+@client.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel):
+    guild_configs.invalidate(channel.guild.id)
+
+@client.event
+async def on_guild_channel_update(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+    guild_configs.invalidate(after.guild.id)
+
+@client.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    guild_configs.invalidate(channel.guild.id)
 
 # --- Main Execution ---
-if __name__ == "__main__":
+async def run_state_server():
+    host, _, port = STATE_STORE_ADDRESS.rpartition(':')
+    server = await serve_state_store(db, host or '127.0.0.1', int(port))
+    await db.run(_init_db)
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__" and sys.argv[1:] == ['--serve-state']:
+    # Shared state server for the remote backend: python bot.py --serve-state
+    db = VerificationDB(DB_NAME)
+    try:
+        asyncio.run(run_state_server())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close()
+elif __name__ == "__main__":
     if not DISCORD_BOT_TOKEN:
-        print(f"{get_log_prefix()} ERROR: DISCORD_BOT_TOKEN missing.")
+        log.error("DISCORD_BOT_TOKEN missing.")
         exit(1)
     if WELCOME_CHANNEL_ID == 0:
-        print(f"{get_log_prefix()} WARNING: WELCOME_CHANNEL_ID environment variable is not set or is invalid.")
+        log.warning("WELCOME_CHANNEL_ID environment variable is not set or is invalid.")
     if not VERIFIED_ROLE_NAME:
-        print(f"{get_log_prefix()} WARNING: VERIFIED_ROLE_NAME environment variable is not set.")
+        log.warning("VERIFIED_ROLE_NAME environment variable is not set.")
+    if SHARD_IDS and not SHARD_COUNT.isdigit():
+        log.error("SHARD_IDS requires a numeric SHARD_COUNT.")
+        exit(1)
     
     try:
-        client.run(DISCORD_BOT_TOKEN)
+        client.run(DISCORD_BOT_TOKEN, log_handler=None) # discord.py logs already go through setup_logging()
     except discord.LoginFailure:
-        print(f"{get_log_prefix()} ERROR: Login failed. Check DISCORD_BOT_TOKEN.")
+        log.error("Login failed. Check DISCORD_BOT_TOKEN.")
     except Exception as e:
-        print(f"{get_log_prefix()} ERROR running bot: {e}")
\ No newline at end of file
+        log.error(f"Error running bot: {e}")
+    finally:
+        verified_flushed = write_buffer.flush_blocking()
+        snapshot_flushed = snapshot_buffer.flush_blocking()
+        deadlines_persisted = verification_scheduler.persist_blocking()
+        if verified_flushed and snapshot_flushed and deadlines_persisted: # Never checkpoint past unsaved state
+            checkpoint_heartbeat.checkpoint_blocking()
+        db.close()
\ No newline at end of file
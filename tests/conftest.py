@@ -0,0 +1,45 @@
+"""Shared setup: bot.py and the fakes in benchmarks/ on the import path, and fixtures that give
+each test a fresh database and fresh copies of bot.py's module-level state."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+import bot  # noqa: E402
+from fake_discord import FakeClient, FakeRest  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Path of a fresh SQLite database, opened as bot.db."""
+    path = str(tmp_path / 'test.db')
+    store = bot.VerificationDB(path)
+    monkeypatch.setattr(bot, 'db', store)
+    yield path
+    store.close()
+
+
+@pytest.fixture
+def bot_state(db_path, monkeypatch):
+    """Fresh write buffers, indexes, scheduler, dispatcher and caches. Message batching is off."""
+    monkeypatch.setattr(bot, 'write_buffer', bot.VerifiedMemberWriteBuffer(bot.WRITE_BUFFER_MAX_SIZE, bot.WRITE_BUFFER_FLUSH_SECONDS))
+    monkeypatch.setattr(bot, 'snapshot_buffer', bot.MemberSnapshotBuffer(bot.WRITE_BUFFER_MAX_SIZE, bot.WRITE_BUFFER_FLUSH_SECONDS))
+    monkeypatch.setattr(bot, 'verified_index', bot.VerifiedMemberIndex())
+    monkeypatch.setattr(bot, 'verification_scheduler', bot.VerificationScheduler(bot.WRITE_BUFFER_FLUSH_SECONDS))
+    monkeypatch.setattr(bot, 'checkpoint_heartbeat', bot.CheckpointHeartbeat(bot.CHECKPOINT_INTERVAL_SECONDS))
+    monkeypatch.setattr(bot, 'kick_executor', bot.KickExecutor(bot.KICK_CONCURRENCY))
+    monkeypatch.setattr(bot, 'message_dispatcher', bot.MessageDispatcher(0))
+    monkeypatch.setattr(bot, 'guild_configs', bot.GuildConfigCache())
+
+
+@pytest.fixture
+def client(bot_state, monkeypatch):
+    """A FakeClient wired into bot.py as its client, with WELCOME_CHANNEL_ID set to 1."""
+    fake = FakeClient(FakeRest(latency=0, limit=0))
+    monkeypatch.setattr(bot, 'client', fake)
+    monkeypatch.setattr(bot, 'WELCOME_CHANNEL_ID', 1)
+    return fake
@@ -0,0 +1,69 @@
+"""Offline catch-up against the fake discord layer in benchmarks/fake_discord.py."""
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+import bot
+
+
+def make_guild(client, members: int, seed: int = 1):
+    """A guild that is not chunked, so catch-up pages through fetch_members. Every member joined
+    long before the catch-up window and about 80% of them are verified."""
+    rng = random.Random(seed)
+    guild = client.add_guild()
+    guild.chunked = False
+    guild.add_text_channel('welcome', bot.WELCOME_CHANNEL_ID)
+    for _ in range(members):
+        guild.add_member(account_age_days=rng.uniform(200, 3000), verified=rng.random() < 0.8, joined_ago_seconds=30 * 86400)
+    return guild
+
+
+def verified_ids_in_db(guild_id: int) -> list[int]:
+    return bot.db.run_blocking(lambda conn: [member_id for (member_id,) in conn.execute(
+        'SELECT member_id FROM verified_members WHERE guild_id = ? ORDER BY member_id', (guild_id,))])
+
+
+async def catch_up(guild):
+    now = datetime.now(timezone.utc)
+    await bot.catch_up_guild(guild, now - timedelta(hours=1), now)
+    await bot.flush_write_buffers()
+    while bot.message_dispatcher.pending():
+        await asyncio.sleep(0.01)
+
+
+def test_rest_catch_up_keeps_members_that_did_not_leave(client):
+    guild = make_guild(client, 2500)
+    verified = sorted(member.id for member in guild.members if member.roles)
+
+    async def run():
+        await bot.init_db()
+        await catch_up(guild) # First start seeds verified_members and member_snapshot
+        await catch_up(guild) # Restart with nobody having left
+
+    asyncio.run(run())
+    assert verified_ids_in_db(guild.id) == verified
+    assert guild.get_channel(bot.WELCOME_CHANNEL_ID).sent == []
+
+
+def test_lean_catch_up_builds_sorted_complete_verified_index(client, monkeypatch):
+    monkeypatch.setattr(bot, 'MEMBER_CACHE', 'lean')
+    guild = make_guild(client, 3500, seed=2)
+    for _ in range(20): # Newcomers waiting to verify, fetched into the cache on demand in lean mode
+        guild.add_member(account_age_days=400)
+
+    async def run():
+        await bot.init_db()
+        now = datetime.now(timezone.utc)
+        for _ in range(2): # First start, then a restart with an empty in-memory index
+            bot.verified_index = bot.VerifiedMemberIndex()
+            progress = {'done': 0, 'failed': 0}
+            await bot.run_guild_catch_up(guild, now - timedelta(hours=1), now, asyncio.Semaphore(1), progress, 1)
+            assert progress['failed'] == 0
+            await bot.flush_write_buffers()
+
+    asyncio.run(run())
+    ids = list(bot.verified_index._guilds[guild.id])
+    assert ids == sorted(ids)
+    assert ids == sorted(member.id for member in guild.members if member.roles)
+    assert ids == verified_ids_in_db(guild.id)
+    assert len(bot.verification_scheduler) == 20
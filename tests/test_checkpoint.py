@@ -0,0 +1,71 @@
+"""Guild checkpoints must never get ahead of the persisted state."""
+import asyncio
+import sqlite3
+import time
+import types
+
+import pytest
+
+import bot
+
+GUILD = types.SimpleNamespace(id=1, shard_id=0)
+
+
+@pytest.fixture
+def heartbeat(bot_state):
+    bot.checkpoint_heartbeat.mark_live(GUILD)
+    return bot.checkpoint_heartbeat
+
+
+def test_checkpoint_persists_buffered_state_first(heartbeat):
+    async def run():
+        await bot.init_db()
+        bot.verification_scheduler.schedule(GUILD.id, 2, time.time() + 600)
+        await bot.mark_member_verified_in_db(GUILD.id, 3)
+        await heartbeat.checkpoint()
+        return (await bot.get_guild_checkpoints(), await bot.db.run(bot._get_pending_verifications),
+                await bot.was_member_verified_in_db(GUILD.id, 3), len(bot.write_buffer))
+
+    checkpoints, pending, verified, buffered = asyncio.run(run())
+    assert GUILD.id in checkpoints
+    assert [(guild_id, member_id) for guild_id, member_id, _, _ in pending] == [(GUILD.id, 2)]
+    assert verified and buffered == 0
+
+
+def test_checkpoint_skipped_when_flush_fails(heartbeat, monkeypatch):
+    async def run():
+        await bot.init_db()
+        bot.verification_scheduler.schedule(GUILD.id, 2, time.time() + 600)
+
+        def fail(*args):
+            raise sqlite3.OperationalError('disk I/O error')
+        monkeypatch.setattr(bot, '_apply_pending_verification_writes', fail)
+        await heartbeat.checkpoint()
+        return await bot.get_guild_checkpoints()
+
+    assert asyncio.run(run()) == {}
+    assert (GUILD.id, 2) in bot.verification_scheduler._dirty
+
+
+def test_reidentified_shard_catches_up_from_checkpoints(client):
+    heartbeat = bot.checkpoint_heartbeat
+    reconnected, other = client.add_guild(), client.add_guild()
+    reconnected.shard_id, other.shard_id = 1, 2
+
+    async def run():
+        await bot.init_db()
+        heartbeat.resume([reconnected, other])
+        await heartbeat.checkpoint()
+        heartbeat.pause(1) # Shard 1 lost its session
+        newcomer = reconnected.add_member(account_age_days=400) # Joined while shard 1 was down
+        await bot.on_shard_ready(1) # Initial connect: left to on_ready
+        assert reconnected.id not in heartbeat._live
+        heartbeat.start()
+        await bot.on_shard_ready(1)
+        heartbeat._task.cancel()
+        return newcomer
+
+    newcomer = asyncio.run(run())
+    assert reconnected.id in heartbeat._live and other.id in heartbeat._live
+    assert (reconnected.id, newcomer.id) in bot.verification_scheduler
+    assert len(bot.verification_scheduler) == 1
@@ -0,0 +1,54 @@
+"""GuildConfig resolution and reloading of per-guild overrides against the fake discord layer."""
+import asyncio
+import json
+import os
+
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def guild(client, monkeypatch):
+    monkeypatch.setattr(bot, 'GOODBYE_MESSAGE', '**{member_name}** just left **{guild_name}**.')
+    return client.add_guild(name='Old Name')
+
+
+def test_guild_rename_recompiles_templates(guild):
+    assert bot.guild_configs.get(guild).goodbye_template.render(member_name='x') == '**x** just left **Old Name**.'
+    guild.name = 'New Name'
+    asyncio.run(bot.on_guild_update(guild, guild))
+    assert bot.guild_configs.get(guild).goodbye_template.render(member_name='x') == '**x** just left **New Name**.'
+
+
+def test_empty_override_disables_template(guild, monkeypatch):
+    monkeypatch.setattr(bot, 'QUICK_LEAVE_GOODBYE_MESSAGE', '**{member_name}** left quickly.')
+    config = bot.GuildConfig(guild, {'QUICK_LEAVE_GOODBYE_MESSAGE': ''})
+    assert config.quick_leave_goodbye_template is None
+    assert config.goodbye_template is not None
+
+
+def test_invalid_override_falls_back_to_default(guild):
+    config = bot.GuildConfig(guild, {'GOODBYE_MESSAGE': 'Bye {unknown_field}'})
+    assert config.goodbye_template.render(member_name='x') == '**x** just left **Old Name**.'
+
+
+def test_unreadable_settings_file_keeps_loaded_overrides(guild, tmp_path, monkeypatch):
+    path = tmp_path / 'guilds.json'
+    path.write_text(json.dumps({str(guild.id): {'GOODBYE_MESSAGE': 'Bye {member_name}'}}))
+    store = bot.GuildSettingsStore(str(path), 60)
+    monkeypatch.setattr(bot, 'guild_settings', store)
+
+    async def run():
+        await bot.init_db()
+        await store.reload()
+        config = bot.guild_configs.get(guild)
+        path.write_text('{"truncated": ')
+        os.utime(path, (1, 1))
+        await store.reload()
+        return config
+
+    config = asyncio.run(run())
+    assert store._mtime == 1 # The watcher does not retry it every poll
+    assert bot.guild_configs.get(guild) is config
+    assert config.goodbye_template.render(member_name='x') == 'Bye x'
@@ -0,0 +1,55 @@
+"""Timeout kicks queued in GuildKickPipeline must not outlive the member's verification."""
+import asyncio
+import time
+
+import bot
+
+
+def make_guild(client):
+    guild = client.add_guild()
+    guild.add_text_channel('welcome', bot.WELCOME_CHANNEL_ID)
+    return guild, guild.add_member(account_age_days=400)
+
+
+def test_verification_cancels_queued_timeout_kick(client):
+    guild, member = make_guild(client)
+
+    async def run():
+        await bot.init_db()
+        await bot.check_member_verification(guild.id, member.id)
+        pipeline = bot.kick_executor.pipelines[guild.id]
+        pipeline._paused_until = time.monotonic() + 0.2 # Hold the kick in the queue, as under a 429
+        await bot.on_member_update(*guild.set_verified(member.id, True))
+        assert pipeline.stats()['queue_depth'] == 0
+        await bot.kick_executor.join(guild.id)
+        return pipeline
+
+    pipeline = asyncio.run(run())
+    assert guild.get_member(member.id) is member
+    assert pipeline.kicked == 0
+
+
+def test_queued_timeout_kick_rechecks_verified_role(client):
+    guild, member = make_guild(client)
+
+    async def run():
+        await bot.init_db()
+        await bot.check_member_verification(guild.id, member.id)
+        guild.set_verified(member.id, True) # Cache updated, on_member_update not handled yet
+        await bot.kick_executor.join(guild.id)
+
+    asyncio.run(run())
+    assert guild.get_member(member.id) is member
+    assert bot.kick_executor.stats()['kicked'] == 0
+
+
+def test_age_kick_is_not_rechecked(client):
+    guild, member = make_guild(client)
+    member.roles.append(guild.verified_role)
+
+    async def run():
+        bot.kick_executor.submit(member, 'Account too new.')
+        await bot.kick_executor.join(guild.id)
+
+    asyncio.run(run())
+    assert guild.get_member(member.id) is None
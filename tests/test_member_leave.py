@@ -0,0 +1,31 @@
+"""Goodbyes for members who leave while the bot is online."""
+import asyncio
+import types
+
+import pytest
+
+import bot
+from fake_discord import FakeUser
+
+
+@pytest.mark.parametrize('flushed', [False, True])
+def test_uncached_quick_leaver_gets_quick_leave_goodbye(client, monkeypatch, flushed):
+    monkeypatch.setattr(bot, 'QUICK_LEAVE_GOODBYE_MESSAGE', '**{member_name}** left quickly.')
+    guild = client.add_guild()
+    channel = guild.add_text_channel('welcome', bot.WELCOME_CHANNEL_ID)
+    member = guild.add_member(account_age_days=400, verified=True, joined_ago_seconds=60)
+
+    async def run():
+        await bot.init_db()
+        await bot.record_member_joined(member)
+        await bot.mark_member_verified_in_db(guild.id, member.id)
+        if flushed: # joined_at read back from member_snapshot instead of the write-behind buffer
+            assert await bot.flush_write_buffers()
+        guild.remove_member(member.id)
+        # Not a discord.Member: the member was not cached, as with MEMBER_CACHE=lean
+        await bot.on_raw_member_remove(types.SimpleNamespace(guild_id=guild.id, user=FakeUser(member.id, member.name)))
+        while bot.message_dispatcher.pending():
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert channel.sent == [f'**{member.name}** left quickly.']
@@ -0,0 +1,46 @@
+"""Rendering of coalesced welcome and goodbye messages by MessageDispatcher."""
+import asyncio
+
+import bot
+
+
+async def drain():
+    while bot.message_dispatcher.pending():
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*(queue.flush_task for queue in bot.message_dispatcher._queues.values() if queue.flush_task))
+
+
+def test_online_burst_uses_live_batch_template(client):
+    guild = client.add_guild(name='Guild')
+    channel = guild.add_text_channel('welcome', bot.WELCOME_CHANNEL_ID)
+    members = [guild.add_member(account_age_days=400) for _ in range(3)]
+
+    async def run():
+        await bot.init_db()
+        for member in members:
+            bot.verification_scheduler.schedule(guild.id, member.id, 1e12)
+            await bot.on_member_update(*guild.set_verified(member.id, True))
+        await drain()
+
+    asyncio.run(run())
+    mentions = ', '.join(member.mention for member in members)
+    assert channel.sent == [f'Welcome {mentions} to **Guild**!']
+
+
+def test_messages_over_the_limit_are_split(client):
+    guild = client.add_guild()
+    channel = guild.add_text_channel('welcome', bot.WELCOME_CHANNEL_ID)
+    long_name = 'x' * 2500
+    template = bot.CompiledTemplate('Left: {member_names_list}', ('member_names_list',))
+
+    async def run():
+        bot.message_dispatcher.goodbye(channel, 'a', 'word ' * 500, template)
+        await drain()
+        bot.message_dispatcher.goodbye(channel, long_name, f'{long_name} left', template)
+        bot.message_dispatcher.goodbye(channel, 'b', 'b left', template)
+        await drain()
+
+    asyncio.run(run())
+    assert all(len(message) <= bot.DISCORD_MESSAGE_LIMIT for message in channel.sent)
+    assert ' '.join(channel.sent[:2]).split() == ['word'] * 500
+    assert channel.sent[2:] == ['Left:', long_name[:bot.DISCORD_MESSAGE_LIMIT], long_name[bot.DISCORD_MESSAGE_LIMIT:], 'Left: b']
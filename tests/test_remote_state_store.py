@@ -0,0 +1,48 @@
+"""RemoteStateStore against an in-process serve_state_store on a free port."""
+import asyncio
+import time
+
+import pytest
+
+import bot
+
+
+def test_round_trips_through_state_server(bot_state, monkeypatch):
+    local = bot.db
+
+    async def run():
+        server = await bot.serve_state_store(local, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        remote = bot.RemoteStateStore(f'127.0.0.1:{port}')
+        monkeypatch.setattr(bot, 'db', remote)
+        try:
+            with pytest.raises(bot.StateStoreError, match='no such table'): # Raised in the server, re-raised by the client
+                await asyncio.to_thread(remote.run_blocking, bot._get_pending_verifications)
+            await bot.init_db()
+
+            await bot.mark_member_verified_in_db(1, 2)
+            await bot.snapshot_buffer.upsert_many(1, [(member_id, 1000.0, member_id % 2 == 0) for member_id in range(1, 26)])
+            assert await bot.flush_write_buffers()
+            verified = await bot.was_member_verified_in_db(1, 2)
+            snapshot = [row async for row in bot.iter_member_snapshot(1, page_size=10)]
+
+            deadline = time.time() + 600
+            bot.verification_scheduler.schedule(1, 3, deadline, deadline - 900)
+            assert await bot.verification_scheduler.persist()
+            restored = bot.VerificationScheduler(1)
+            await restored.load()
+            record = restored.index.get(1, 3)
+
+            blocking_rows = await asyncio.to_thread(remote.run_blocking, bot._get_pending_verifications)
+            return verified, snapshot, record, blocking_rows, deadline
+        finally:
+            remote.close()
+            server.close()
+            await server.wait_closed()
+
+    verified, snapshot, record, blocking_rows, deadline = asyncio.run(run())
+    assert verified
+    assert [member_id for member_id, _ in snapshot] == list(range(1, 26))
+    assert all(bool(is_verified) == (member_id % 2 == 0) for member_id, is_verified in snapshot)
+    assert (record.deadline, record.waiting_since) == (deadline, deadline - 900)
+    assert [tuple(row[:2]) for row in blocking_rows] == [(1, 3)]
@@ -0,0 +1,61 @@
+"""VerificationScheduler records: persistence, and cancellation of a check in progress."""
+import asyncio
+import sqlite3
+import time
+
+import bot
+
+
+def test_waiting_since_survives_restart(db_path):
+    joined = time.time() - 120
+
+    async def run():
+        await bot.init_db()
+        scheduler = bot.VerificationScheduler(1)
+        scheduler.schedule(1, 2, joined + 600, joined)
+        await scheduler.persist()
+        restored = bot.VerificationScheduler(1)
+        await restored.load()
+        return restored.index.get(1, 2)
+
+    record = asyncio.run(run())
+    assert record.deadline == joined + 600
+    assert record.waiting_since == joined
+
+
+def test_rows_from_before_waiting_since_are_estimated(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE pending_verifications (guild_id INTEGER NOT NULL, member_id INTEGER NOT NULL, '
+                 'deadline REAL NOT NULL, PRIMARY KEY (guild_id, member_id))')
+    conn.execute('INSERT INTO pending_verifications VALUES (1, 2, 5000.0)')
+    conn.commit()
+    conn.close()
+
+    async def run():
+        await bot.init_db()
+        scheduler = bot.VerificationScheduler(1)
+        await scheduler.load()
+        return scheduler.index.get(1, 2)
+
+    record = asyncio.run(run())
+    assert record.waiting_since == 5000.0 - bot.VERIFICATION_TIMEOUT_SECONDS
+
+
+def test_check_cancelled_during_fetch_does_not_kick(client):
+    guild = client.add_guild()
+    member = guild.add_member(account_age_days=400)
+
+    async def run():
+        await bot.init_db()
+        scheduler = bot.verification_scheduler
+        scheduler.schedule(guild.id, member.id, time.time() - 1)
+        (record,) = scheduler._pop_due(time.time(), 1)
+        check = asyncio.create_task(scheduler._check(record))
+        await asyncio.sleep(0) # The check is now waiting on fetch_member
+        assert scheduler.cancel(guild.id, member.id)
+        await check
+        await bot.kick_executor.join()
+
+    asyncio.run(run())
+    assert guild.get_member(member.id) is member
+    assert bot.kick_executor.stats()['kicked'] == 0